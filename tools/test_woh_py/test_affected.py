@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions.affected import affected_targets, parse_dep_file, parse_make_database  # noqa: E402
+
+MAKE_DATABASE = '''# Variables
+
+CC = cc
+
+# Files
+
+# Not a target:
+.c.o:
+\t$(COMPILE.c) $(OUTPUT_OPTION) $<
+
+app.bin: main.o util.o | out
+#  Implicit rule search has not been done.
+\tgcc -o $@ $^
+
+app.bin: LDFLAGS := -static
+
+test_app: util.o test.o
+\tgcc -o $@ $^
+
+# Not a target:
+util.c:
+
+all: app.bin test_app
+
+.PHONY: all clean
+
+# files hash-table stats:
+# Load=12/1024=1%, Rehash=0, Collisions=0/40=0%
+'''
+
+
+class TestAffected(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def path(self, name):
+        return os.path.join(self.build_dir, name)
+
+    def write(self, name, content):
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+        return self.path(name)
+
+    def test_parse_dep_file(self):
+        dep_file = self.write('main.d', 'main.o: main.c my\\ header.h \\\n'
+                                        ' $$dollar.h\n'
+                                        '\n'
+                                        'my\\ header.h:\n'
+                                        '$$dollar.h:\n')
+        self.assertEqual(parse_dep_file(dep_file, self.build_dir),
+                         [(['main.o'], [self.path('main.c'), self.path('my header.h'), self.path('$dollar.h')])])
+
+    def test_parse_dep_file_multiple_targets(self):
+        dep_file = self.write('util.d', 'util.o util.d: util.c ../include/util.h\n')
+        self.assertEqual(parse_dep_file(dep_file, self.build_dir),
+                         [(['util.o', 'util.d'], [self.path('util.c'),
+                                                  os.path.realpath(os.path.join(self.build_dir, '..', 'include',
+                                                                                'util.h'))])])
+
+    def test_parse_make_database(self):
+        rules, phony = parse_make_database(MAKE_DATABASE, self.build_dir)
+        self.assertEqual(rules, [
+            (['app.bin'], [self.path('main.o'), self.path('util.o')]),
+            (['test_app'], [self.path('util.o'), self.path('test.o')]),
+            (['all'], [self.path('app.bin'), self.path('test_app')]),
+        ])
+        self.assertEqual(phony, {'all', 'clean'})
+
+    def test_affected_objects(self):
+        self.write('main.d', 'main.o: main.c util.h\nutil.h:\n')
+        self.write('util.d', 'util.o: util.c util.h\nutil.h:\n')
+        self.assertEqual(affected_targets(self.build_dir, [self.path('util.h')]), (['main.o', 'util.o'], []))
+        self.assertEqual(affected_targets(self.build_dir, [self.path('main.c')]), (['main.o'], []))
+
+    def test_affected_goals(self):
+        self.write('main.d', 'main.o: main.c util.h\nutil.h:\n')
+        self.write('util.d', 'util.o: util.c util.h\nutil.h:\n')
+        self.write('test.d', 'test.o: test.c\n')
+        database = parse_make_database(MAKE_DATABASE, self.build_dir)
+        self.assertEqual(affected_targets(self.build_dir, [self.path('main.c')], database), (['app.bin'], []))
+        self.assertEqual(affected_targets(self.build_dir, [self.path('util.h')], database),
+                         (['app.bin', 'test_app'], []))
+        self.assertEqual(affected_targets(self.build_dir, [self.path('test.c')], database), (['test_app'], []))
+
+    def test_unmapped(self):
+        self.write('main.d', 'main.o: main.c\n')
+        changed = [self.path('main.c'), self.path('new.c'), self.path('Makefile'), self.path('README.md')]
+        self.assertEqual(affected_targets(self.build_dir, changed),
+                         (['main.o'], [self.path('new.c'), self.path('Makefile')]))
+
+    def test_dep_index_updated(self):
+        self.write('main.d', 'main.o: main.c\n')
+        self.assertEqual(affected_targets(self.build_dir, [self.path('util.h')]), ([], [self.path('util.h')]))
+        self.write('main.d', 'main.o: main.c util.h\n')
+        # a new size, the cached index must not be used
+        self.assertEqual(affected_targets(self.build_dir, [self.path('util.h')]), (['main.o'], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
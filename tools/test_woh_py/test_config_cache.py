@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions.config_cache import (CONFIG_DIR, CONFIG_KEYS_DIR, load_config_cache, make_variables,  # noqa: E402
+                                         update_config_cache)
+from woh_py_actions.errors import FatalError  # noqa: E402
+
+
+class TestConfigCache(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def stamp(self, key):
+        return os.path.join(self.build_dir, CONFIG_DIR, CONFIG_KEYS_DIR, key)
+
+    def read_stamp(self, key):
+        with open(self.stamp(key)) as f:
+            return f.read()
+
+    def values(self):
+        return dict((key, entry['value']) for key, entry in load_config_cache(self.build_dir).items())
+
+    def test_merge(self):
+        _, changes = update_config_cache(self.build_dir, ['FOO=1', 'BAR=a=b'])
+        self.assertEqual(changes, [('FOO', None, '1'), ('BAR', None, 'a=b')])
+        _, changes = update_config_cache(self.build_dir, ['FOO=2', 'BAZ='])
+        self.assertEqual(changes, [('FOO', '1', '2'), ('BAZ', None, '')])
+        self.assertEqual(self.values(), {'FOO': '2', 'BAR': 'a=b', 'BAZ': ''})
+        cache, changes = update_config_cache(self.build_dir, ['FOO=2'])
+        self.assertEqual(changes, [])
+        self.assertEqual(make_variables(self.build_dir, cache),
+                         ['WOH_CONFIG_DIR=%s' % os.path.join(self.build_dir, CONFIG_DIR), 'FOO=2', 'BAR=a=b', 'BAZ='])
+
+    def test_remove(self):
+        update_config_cache(self.build_dir, ['FOO=1', 'BAR=2'])
+        _, changes = update_config_cache(self.build_dir, [], ['FOO', 'UNKNOWN'])
+        self.assertEqual(changes, [('FOO', '1', None)])
+        self.assertEqual(self.values(), {'BAR': '2'})
+        # rules depending on the removed key rebuild once
+        self.assertEqual(self.read_stamp('FOO'), 'unset\n')
+        _, changes = update_config_cache(self.build_dir, [], ['FOO'])
+        self.assertEqual(changes, [])
+
+        _, changes = update_config_cache(self.build_dir, ['FOO=1'])
+        self.assertEqual(changes, [('FOO', None, '1')])
+        self.assertNotEqual(self.read_stamp('FOO'), 'unset\n')
+
+    def test_stamps_rewritten_only_on_changes(self):
+        update_config_cache(self.build_dir, ['FOO=1', 'BAR=1'])
+        os.utime(self.stamp('FOO'), (1000000000, 1000000000))
+        os.utime(self.stamp('BAR'), (1000000000, 1000000000))
+        foo_stamp = self.read_stamp('FOO')
+
+        update_config_cache(self.build_dir, ['FOO=1', 'BAR=2'])
+        self.assertEqual(self.read_stamp('FOO'), foo_stamp)
+        self.assertEqual(os.stat(self.stamp('FOO')).st_mtime, 1000000000)
+        self.assertNotEqual(os.stat(self.stamp('BAR')).st_mtime, 1000000000)
+
+        update_config_cache(self.build_dir, [], ['FOO'])
+        self.assertNotEqual(os.stat(self.stamp('FOO')).st_mtime, 1000000000)
+
+    def test_existing_gitignore_kept(self):
+        gitignore = os.path.join(self.build_dir, CONFIG_DIR, '.gitignore')
+        update_config_cache(self.build_dir, ['FOO=1'])
+        with open(gitignore) as f:
+            self.assertEqual(f.read(), '*\n')
+        with open(gitignore, 'w') as f:
+            f.write('*\n!keys/\n')
+        update_config_cache(self.build_dir, ['FOO=2'])
+        with open(gitignore) as f:
+            self.assertEqual(f.read(), '*\n!keys/\n')
+
+    def test_invalid_keys(self):
+        for entry in ('FOO', '1FOO=1', 'FOO-BAR=1', '=1'):
+            with self.assertRaises(FatalError):
+                update_config_cache(self.build_dir, [entry])
+        with self.assertRaises(FatalError):
+            update_config_cache(self.build_dir, [], ['FOO=1'])
+        self.assertEqual(load_config_cache(self.build_dir), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions.coordination import RUNNING, SUCCEEDED, BuildDirLock  # noqa: E402
+from woh_py_actions.errors import FatalError  # noqa: E402
+
+REQUEST = {'tasks': [['all', {}]], 'define_cache_entry': [], 'undefine_cache_entry': []}
+
+
+class TestBuildDirLock(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = os.path.realpath(tempfile.mkdtemp())
+        self.locks = []
+
+    def tearDown(self):
+        for lock in self.locks:
+            lock.release()
+        shutil.rmtree(self.build_dir)
+
+    def lock(self):
+        # flock() locks belong to the open file, so each lock conflicts with the others also in one process
+        lock = BuildDirLock(self.build_dir)
+        self.locks.append(lock)
+        return lock
+
+    def acquire_in_thread(self, lock, request, **kwargs):
+        result = {}
+
+        def acquire():
+            try:
+                result['reused'] = lock.acquire(request, **kwargs)
+            except FatalError as e:
+                result['error'] = e
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        # the waiting run has read the state of the holder once it waits
+        time.sleep(0.5)
+        return thread, result
+
+    def test_result_reused(self):
+        holder = self.lock()
+        self.assertIsNone(holder.acquire(REQUEST))
+        self.assertEqual(holder.read_state()['status'], RUNNING)
+        thread, result = self.acquire_in_thread(self.lock(), REQUEST)
+        self.assertTrue(thread.is_alive())
+        holder.succeeded()
+        holder.release()
+        thread.join(5)
+        self.assertEqual(result['reused']['status'], SUCCEEDED)
+        self.assertEqual(result['reused']['pid'], os.getpid())
+
+    def test_other_request_executed(self):
+        holder = self.lock()
+        holder.acquire(REQUEST)
+        other = dict(REQUEST, define_cache_entry=['FOO=1'])
+        thread, result = self.acquire_in_thread(self.lock(), other)
+        holder.succeeded()
+        holder.release()
+        thread.join(5)
+        self.assertIsNone(result['reused'])
+        state = holder.read_state()
+        self.assertEqual((state['request'], state['status']), (other, RUNNING))
+
+    def test_failed_run_not_reused(self):
+        holder = self.lock()
+        holder.acquire(REQUEST)
+        thread, result = self.acquire_in_thread(self.lock(), REQUEST)
+        holder.release()
+        thread.join(5)
+        self.assertIsNone(result['reused'])
+
+    def test_timeout(self):
+        holder = self.lock()
+        holder.acquire(REQUEST)
+        for timeout in (0, 0.3):
+            start = time.time()
+            with self.assertRaises(FatalError):
+                self.lock().acquire(REQUEST, timeout=timeout)
+            self.assertLess(time.time() - start, 2)
+        # read-only runs wait for the exclusive holder as well
+        with self.assertRaises(FatalError):
+            self.lock().acquire(REQUEST, exclusive=False, timeout=0)
+
+        # the lock is taken once it is released within the timeout
+        thread, result = self.acquire_in_thread(self.lock(), REQUEST, timeout=5)
+        holder.release()
+        thread.join(5)
+        self.assertEqual(result, {'reused': None})
+
+    def test_shared(self):
+        self.assertIsNone(self.lock().acquire(REQUEST, exclusive=False))
+        self.assertIsNone(self.lock().acquire(REQUEST, exclusive=False, timeout=0))
+        with self.assertRaises(FatalError):
+            self.lock().acquire(REQUEST, timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
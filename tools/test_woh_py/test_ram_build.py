@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions.ram_build import prepare_ram_build_dir, ram_build_path, sync_back  # noqa: E402
+
+
+class TestRamBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.build_dir = os.path.join(self.tmp, 'build')
+        self.ram_root = os.path.join(self.tmp, 'ram')
+        os.makedirs(self.build_dir)
+        os.makedirs(self.ram_root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, directory, name, content):
+        path = os.path.join(directory, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def read(self, directory, name):
+        with open(os.path.join(directory, name)) as f:
+            return f.read()
+
+    def test_stale_ram_dir_removed(self):
+        self.write(self.build_dir, 'main.o', 'object')
+        stale_dir = ram_build_path(self.build_dir, self.ram_root)
+        self.write(stale_dir, 'main.o', 'newer object of an interrupted run')
+        self.write(stale_dir, 'old.o', 'object')
+        ram_dir = prepare_ram_build_dir(self.build_dir, self.ram_root)
+        self.assertEqual(ram_dir, stale_dir)
+        self.assertEqual(sorted(os.listdir(ram_dir)), ['main.o'])
+        self.assertEqual(self.read(ram_dir, 'main.o'), 'object')
+
+    def test_sync_back(self):
+        self.write(self.build_dir, 'main.o', 'object 1')
+        self.write(self.build_dir, 'util.o', 'object')
+        self.write(self.build_dir, 'sub/app.bin', 'binary')
+        self.write(self.build_dir, 'notes.txt', 'user file')
+        ram_dir = prepare_ram_build_dir(self.build_dir, self.ram_root)
+
+        self.write(ram_dir, 'main.o', 'object 2')
+        os.remove(os.path.join(ram_dir, 'util.o'))
+        shutil.rmtree(os.path.join(ram_dir, 'sub'))
+        os.remove(os.path.join(ram_dir, 'notes.txt'))
+        self.write(ram_dir, 'tmp.txt', 'not synced')
+        synced, removed = sync_back(ram_dir, self.build_dir, ['*.o', '*.bin'])
+        self.assertEqual(synced, ['main.o'])
+        self.assertEqual(sorted(removed), [os.path.join('sub', 'app.bin'), 'util.o'])
+        self.assertEqual(self.read(self.build_dir, 'main.o'), 'object 2')
+        # only build outputs are removed
+        self.assertEqual(sorted(os.listdir(self.build_dir)), ['main.o', 'notes.txt', 'sub'])
+
+        self.assertEqual(sync_back(ram_dir, self.build_dir, ['*.o', '*.bin']), ([], []))
+
+    def test_dep_file_paths(self):
+        self.write(self.build_dir, 'main.d', 'main.o: %s/gen/config.h %s2/other.h\n' % (self.build_dir,
+                                                                                           self.build_dir))
+        ram_dir = prepare_ram_build_dir(self.build_dir, self.ram_root)
+        self.assertEqual(self.read(ram_dir, 'main.d'), 'main.o: %s/gen/config.h %s2/other.h\n' % (ram_dir,
+                                                                                                 self.build_dir))
+
+        self.write(ram_dir, 'util.d', 'util.o: util.c %s/gen/config.h\n' % ram_dir)
+        synced, _ = sync_back(ram_dir, self.build_dir, ['*.d'])
+        self.assertEqual(synced, ['util.d'])
+        self.assertEqual(self.read(self.build_dir, 'main.d'), 'main.o: %s/gen/config.h %s2/other.h\n' % (
+            self.build_dir, self.build_dir))
+        self.assertEqual(self.read(self.build_dir, 'util.d'), 'util.o: util.c %s/gen/config.h\n' % self.build_dir)
+        self.assertEqual(os.stat(os.path.join(self.build_dir, 'util.d')).st_mtime_ns,
+                         os.stat(os.path.join(ram_dir, 'util.d')).st_mtime_ns)
+
+
+if __name__ == '__main__':
+    unittest.main()
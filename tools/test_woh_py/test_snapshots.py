@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions.snapshots import (SnapshotStore, git_worktree_clean, restore_snapshot, save_snapshot,  # noqa: E402
+                                      snapshot_files)
+
+BUDGET = 1024 * 1024 * 1024
+
+
+class TestSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.tmp = os.path.realpath(tempfile.mkdtemp())
+        self.project_dir = os.path.join(self.tmp, 'project')
+        os.makedirs(self.project_dir)
+        subprocess.check_call(['git', 'init', '-q', self.project_dir])
+        self.write('.gitignore', '.config\n*.o\n*.d\napp.bin\n.woh*\n')
+        self.write('main.c', 'int main(void) { return 0; }\n')
+        self.store = SnapshotStore(os.path.join(self.tmp, 'store'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.project_dir, name)
+
+    def write(self, name, content):
+        if not os.path.isdir(os.path.dirname(self.path(name))):
+            os.makedirs(os.path.dirname(self.path(name)))
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(self.path(name)) as f:
+            return f.read()
+
+    def test_only_build_outputs(self):
+        self.write('.config', 'CONFIG_A=y\n')
+        self.write('main.o', 'object')
+        self.write('main.d', 'main.o: main.c\n')
+        self.write('app.bin', 'binary')
+        self.write('.woh_config/keys/FOO', 'hash\n')
+        self.write('.woh_config/woh_config.json', '{}\n')
+        self.assertEqual(snapshot_files(self.project_dir, self.project_dir), ['app.bin', 'main.d', 'main.o'])
+
+    def test_out_of_tree_build_dir(self):
+        build_dir = os.path.join(self.tmp, 'build')
+        for name in ('main.o', 'notes.txt', '.woh_config/keys/main.o'):
+            path = os.path.join(build_dir, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as f:
+                f.write(name)
+        self.assertEqual(snapshot_files(self.project_dir, build_dir), ['main.o'])
+
+    def test_restore_keeps_user_files(self):
+        self.write('.config', 'CONFIG_A=y\n')
+        self.write('main.o', 'object 1')
+        self.write('.woh_config/keys/FOO', 'hash 1\n')
+        save_snapshot(self.store, self.project_dir, self.project_dir, 'tree1', BUDGET)
+
+        self.write('.config', 'CONFIG_A=n\n')
+        self.write('main.o', 'object 2')
+        self.write('.woh_config/keys/FOO', 'hash 2\n')
+        self.assertEqual(restore_snapshot(self.store, self.project_dir, self.project_dir, 'tree1'), 1)
+        self.assertEqual(self.read('main.o'), 'object 1')
+        self.assertEqual(self.read('.config'), 'CONFIG_A=n\n')
+        self.assertEqual(self.read('.woh_config/keys/FOO'), 'hash 2\n')
+
+    def test_restored_files_newer_than_sources(self):
+        self.write('main.o', 'object')
+        os.utime(self.path('main.o'), (1000000000, 1000000000))
+        save_snapshot(self.store, self.project_dir, self.project_dir, 'tree1', BUDGET)
+        os.remove(self.path('main.o'))
+        self.write('main.c', 'int main(void) { return 1; }\n')
+        restore_snapshot(self.store, self.project_dir, self.project_dir, 'tree1')
+        self.assertGreaterEqual(os.stat(self.path('main.o')).st_mtime_ns, os.stat(self.path('main.c')).st_mtime_ns)
+
+    def git(self, *args):
+        subprocess.check_call(['git', '-c', 'user.name=woh', '-c', 'user.email=woh@localhost'] + list(args),
+                              cwd=self.project_dir)
+
+    def test_git_worktree_clean(self):
+        outputs = [self.path('test_results.xml'), self.path('package')]
+        self.git('add', '.gitignore', 'main.c')
+        self.git('commit', '-q', '-m', 'init')
+        self.assertTrue(git_worktree_clean(self.project_dir, outputs))
+
+        # written by woh.py itself
+        self.write('test_results.xml', '<testsuites/>\n')
+        self.write('package/manifest.json', '{}\n')
+        self.write('.woh.lock', '')
+        self.assertTrue(git_worktree_clean(self.project_dir, outputs))
+        self.assertFalse(git_worktree_clean(self.project_dir))
+
+        # a new source not added to git yet
+        self.write('util.c', 'int util(void) { return 0; }\n')
+        self.assertFalse(git_worktree_clean(self.project_dir, outputs))
+        os.remove(self.path('util.c'))
+        self.write('main.c', 'int main(void) { return 1; }\n')
+        self.assertFalse(git_worktree_clean(self.project_dir, outputs))
+
+    def write_object(self):
+        # incompressible, each snapshot takes about 4 KB of the store
+        with open(self.path('main.o'), 'wb') as f:
+            f.write(os.urandom(4096))
+
+    def test_evict_least_recently_used(self):
+        budget = 2 * 4096 + 2048
+        for key in ('tree1', 'tree2'):
+            self.write_object()
+            save_snapshot(self.store, self.project_dir, self.project_dir, key, budget)
+        # tree1 is used again, tree2 is now the least recently used snapshot
+        restore_snapshot(self.store, self.project_dir, self.project_dir, 'tree1')
+        self.write_object()
+        save_snapshot(self.store, self.project_dir, self.project_dir, 'tree3', budget)
+        self.assertEqual(sorted(os.listdir(self.store.manifests_dir)), ['tree1.json', 'tree3.json'])
+        self.assertLessEqual(self.store.size(), budget)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from woh_py_actions import supervisor  # noqa: E402
+from woh_py_actions.errors import FatalError  # noqa: E402
+
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.grace = supervisor.ESCALATION_GRACE
+        supervisor.ESCALATION_GRACE = 0.5
+
+    def tearDown(self):
+        supervisor.ESCALATION_GRACE = self.grace
+        supervisor._interrupts = 0
+        supervisor._interrupted = None
+        shutil.rmtree(self.tmp)
+
+    def assertProcessGone(self, pid_file):
+        with open(os.path.join(self.tmp, pid_file)) as f:
+            pid = int(f.read())
+        # the killed process may not be reaped by its parent yet
+        for _ in range(50):
+            try:
+                with open('/proc/%d/stat' % pid) as f:
+                    if f.read().split(') ')[1].startswith('Z'):
+                        return
+            except (IOError, OSError):
+                return
+            time.sleep(0.1)
+        self.fail('process %d is still running' % pid)
+
+    def test_exit_code(self):
+        returncode, usage = supervisor.Supervisor('sh').run(['sh', '-c', 'exit 3'], self.tmp, None)
+        self.assertEqual(returncode, 3)
+        self.assertGreaterEqual(usage.wall_time, 0)
+
+    def test_timeout_stops_process_group(self):
+        tool = supervisor.Supervisor('sh', timeout=1)
+        start = time.time()
+        returncode, _ = tool.run(['sh', '-c', 'sleep 30 & echo $! > child.pid; wait'], self.tmp, None)
+        self.assertTrue(tool.timed_out)
+        self.assertNotEqual(returncode, 0)
+        self.assertLess(time.time() - start, 5)
+        self.assertProcessGone('child.pid')
+
+    def test_escalation(self):
+        tool = supervisor.Supervisor('sh', timeout=0.5)
+        # ignores SIGINT and SIGTERM, only SIGKILL stops it
+        returncode, _ = tool.run(['sh', '-c', 'trap "" INT TERM; while true; do sleep 0.1; done'], self.tmp, None)
+        self.assertTrue(tool.timed_out)
+        self.assertEqual(returncode, -signal.SIGKILL)
+
+    def test_interrupt(self):
+        errors = []
+
+        def run():
+            try:
+                supervisor.Supervisor('sh').run(['sh', '-c', 'sleep 30 & echo $! > child.pid; wait'], self.tmp, None)
+            except FatalError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        while not os.path.exists(os.path.join(self.tmp, 'child.pid')):
+            time.sleep(0.05)
+        supervisor.interrupt(signal.SIGINT)
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertIn('interrupted by SIGINT', str(errors[0]))
+        self.assertProcessGone('child.pid')
+
+        # nothing is started after an interrupt
+        with self.assertRaises(FatalError):
+            supervisor.Supervisor('true').run(['true'], self.tmp, None)
+
+    def test_interrupt_without_tools(self):
+        with self.assertRaises(FatalError):
+            supervisor.interrupt(signal.SIGTERM)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# imported as a module, pytest would collect test_key() and TestResult otherwise
+from woh_py_actions import test_runner  # noqa: E402
+
+
+class TestTestRunner(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = os.path.realpath(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def path(self, name):
+        return os.path.join(self.build_dir, name)
+
+    def write(self, name, content, executable=False):
+        if not os.path.isdir(os.path.dirname(self.path(name))):
+            os.makedirs(os.path.dirname(self.path(name)))
+        with open(self.path(name), 'w') as f:
+            f.write(content)
+        if executable:
+            os.chmod(self.path(name), 0o755)
+
+    def test_discover_tests(self):
+        self.write('test_a', '#!/bin/sh\n', executable=True)
+        self.write('sub/b_test', '#!/bin/sh\n', executable=True)
+        self.write('test_data.txt', 'not executable')
+        self.write('data/input', 'x')
+        os.symlink('data', self.path('test_data'))
+        self.write('package/test_a', '#!/bin/sh\n', executable=True)
+        self.assertEqual(test_runner.discover_tests(self.build_dir, ['test_*', '*_test'], [self.path('package')]),
+                         ['sub/b_test', 'test_a'])
+
+    def test_inputs_hash(self):
+        self.write('data/input', 'x')
+        os.symlink('.', self.path('data/loop'))
+        first = test_runner.inputs_hash([self.path('data')])
+        self.assertEqual(test_runner.inputs_hash([self.path('data')]), first)
+        self.write('data/input', 'y')
+        self.assertNotEqual(test_runner.inputs_hash([self.path('data')]), first)
+
+    def test_results_cached(self):
+        self.write('test_pass', '#!/bin/sh\necho passed\n', executable=True)
+        self.write('test_fail', '#!/bin/sh\necho failed\nexit 3\n', executable=True)
+        tests = ['test_fail', 'test_pass']
+        results = test_runner.run_tests(self.build_dir, tests, jobs=2)
+        self.assertEqual([(r.status, r.returncode) for r in results], [(test_runner.FAILED, 3),
+                                                                        (test_runner.PASSED, 0)])
+        self.assertIn('failed', results[0].output)
+
+        results = test_runner.run_tests(self.build_dir, tests, jobs=2)
+        self.assertEqual([r.status for r in results], [test_runner.FAILED, test_runner.CACHED])
+
+        # a rebuilt shared library invalidates the results
+        self.write('libfoo.so', 'v2')
+        results = test_runner.run_tests(self.build_dir, tests, jobs=2)
+        self.assertEqual([r.status for r in results], [test_runner.FAILED, test_runner.PASSED])
+
+    def test_timeout(self):
+        self.write('test_slow', '#!/bin/sh\nsleep 30\n', executable=True)
+        result = test_runner.run_test(self.build_dir, 'test_slow', timeout=1)
+        self.assertEqual(result.status, test_runner.FAILED)
+        self.assertLess(result.duration, 10)
+        self.assertIn('Timed out after 1 seconds', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
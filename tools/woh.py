@@ -12,6 +12,7 @@ from importlib import import_module
 from pkgutil import iter_modules
 
 from woh_py_actions.errors import FatalError
+from woh_py_actions.supervisor import interrupt
 from woh_py_actions.tools import realpath, woh_version, executable_exists, merge_action_lists
 
 PYTHON = sys.executable
@@ -77,9 +78,9 @@ def debug_print_woh_version():
         print_warning('WOH version unknown')
 
 
-def signal_handler():
-    # The Ctrl+C processed by other threads inside
-    pass
+def signal_handler(signum, _frame):
+    # The build tools started by any thread are stopped, see woh_py_actions/supervisor.py
+    interrupt(signum)
 
 
 class PropertyDict(dict):
@@ -121,13 +122,21 @@ def init_cli(verbose_output=None):
             self.deprecation = deprecation
 
     class Task(object):
-        def __init__(self, callback, name, aliases, dependencies, order_dependencies, action_args):
+        def __init__(self, callback, name, aliases, dependencies, order_dependencies, action_args, read_only=False):
             self.callback = callback
             self.name = name
             self.dependencies = dependencies
             self.order_dependencies = order_dependencies
             self.action_args = action_args
             self.aliases = aliases
+            # bool, or a function of the action arguments
+            self.read_only = read_only
+
+        def is_read_only(self):
+            """Return True if the task doesn't change the build directory."""
+            if callable(self.read_only):
+                return self.read_only(self.action_args)
+            return self.read_only
 
         def __call__(self, context, global_args, action_args=None):
             if action_args is None:
@@ -168,12 +177,14 @@ def init_cli(verbose_output=None):
                 dependencies=None,
                 order_dependencies=None,
                 hidden=False,
+                read_only=False,
                 **kwargs):
             super(Action, self).__init__(name, **kwargs)
 
             self.name = self.name or self.callback.__name__
             self.deprecated = deprecated
             self.hidden = hidden
+            self.read_only = read_only
 
             if aliases is None:
                 aliases = []
@@ -188,6 +199,7 @@ def init_cli(verbose_output=None):
 
             if order_dependencies is None:
                 order_dependencies = []
+            self.dependencies = dependencies
 
             # Show first line of help if short help is missing
             self.short_help = self.short_help or self.help.split('\n')[0]
@@ -212,6 +224,7 @@ def init_cli(verbose_output=None):
                         order_dependencies=order_dependencies,
                         action_args=action_args,
                         aliases=self.aliases,
+                        read_only=self.read_only,
                     )
                 self.callback = wrapped_callback
 
@@ -283,6 +296,9 @@ def init_cli(verbose_output=None):
             # Global options validators
             self.global_action_callbacks = all_actions.get('global_action_callbacks', [])
 
+            # Global finalizers, executed after all actions have succeeded
+            self.global_action_finalizers = all_actions.get('global_action_finalizers', [])
+
             # Actions
             for name, action in all_actions.get('actions', {}).items():
                 arguments = action.pop('arguments', [])
@@ -370,12 +386,21 @@ def init_cli(verbose_output=None):
                     option = next((o for o in ctx.command.params if o.name == key), None)
 
                     if option and (option.scope.is_global or option.scope.is_shared):
-                        pass
+                        local_value = task.action_args.pop(key)
+                        global_value = global_args[key]
+                        default = () if option.multiple else option.default
+
+                        if global_value != default and local_value != default and global_value != local_value:
+                            raise FatalError(
+                                'Option "%s" provided for "%s" is already defined to a different value. '
+                                'This option can appear at most once in the command line.' % (key, task.name))
+                        if local_value != default:
+                            global_args[key] = local_value
 
             check_deprecation(ctx)
 
             # Make sure that define_cache_entry is mutable list and can be modified in callbacks
-            # global_args.define_cache_entry = list(global_args.define_cache_entry)
+            global_args.define_cache_entry = list(global_args.define_cache_entry)
 
             # Execute all global action callback
             for action_callback in ctx.command.global_action_callbacks:
@@ -404,6 +429,12 @@ def init_cli(verbose_output=None):
                             )
                             dep_task = ctx.invoke(ctx.command.get_command(ctx, dep))
 
+                            # Remove options with global scope from invoke tasks because they are already in global_args
+                            for key in list(dep_task.action_args):
+                                option = next((o for o in ctx.command.params if o.name == key), None)
+                                if option and (option.scope.is_global or option.scope.is_shared):
+                                    dep_task.action_args.pop(key)
+
                         tasks.insert(0, dep_task)
                         dependecies_processed = False
 
@@ -429,6 +460,9 @@ def init_cli(verbose_output=None):
                     print('Executing action: %s' % name_with_aliases)
                     task(ctx, global_args, task.action_args)
 
+                for action_finalizer in ctx.command.global_action_finalizers:
+                    action_finalizer(ctx, global_args, tasks_to_run)
+
                 self._print_closing_message(global_args, tasks_to_run.keys())
 
             return tasks_to_run
@@ -487,8 +521,9 @@ def init_cli(verbose_output=None):
 
 
 def main():
-    # Processing of Ctrl+C event for all threads made by main()
+    # Processing of Ctrl+C and SIGTERM events for all threads made by main()
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
     checks_output = check_environment()
     cli = init_cli(verbose_output=checks_output)
     # the argument `prog_name` must contain name of the file - not the absolute path to it!
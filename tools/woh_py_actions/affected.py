@@ -0,0 +1,187 @@
+import fnmatch
+import json
+import os
+import re
+import subprocess
+
+from .constants import AFFECTED_BUILD_FILES
+from .errors import FatalError
+from .tools import walk_files, write_atomic
+
+DEP_INDEX_FILE = '.woh_depindex.json'
+# bump when the format of the cached index changes
+_DEP_INDEX_VERSION = 1
+
+_RULE_SEPARATOR_RE = re.compile(r':(?:\s+|$)')
+
+
+def changed_files(project_dir, rev):
+    """Return the real paths of files changed in the work tree of 'project_dir' since git revision 'rev'."""
+    try:
+        toplevel = subprocess.check_output(['git', 'rev-parse', '--show-toplevel'],
+                                           cwd=project_dir).decode('utf-8').strip()
+        diff = subprocess.check_output(['git', 'diff', '--name-only', '-z', rev, '--'], cwd=toplevel)
+        untracked = subprocess.check_output(['git', 'ls-files', '--others', '--exclude-standard', '-z'], cwd=toplevel)
+    except (subprocess.CalledProcessError, OSError):
+        raise FatalError('Cannot list the files changed since "%s" in %s' % (rev, project_dir))
+    names = (diff + untracked).decode('utf-8').split('\0')
+    return sorted(set(os.path.realpath(os.path.join(toplevel, name)) for name in names if name))
+
+
+def _split_rule(line):
+    """Split a make rule line into its target names and normal prerequisite names, None if it isn't a rule."""
+    parts = _RULE_SEPARATOR_RE.split(line.replace('\\ ', '\0').replace('$$', '$'), 1)
+    if len(parts) != 2 or '=' in parts[1]:
+        # not a rule, or a target-specific variable
+        return None
+    # order-only prerequisites don't make the target out of date
+    prerequisites = parts[1].partition('|')[0]
+    return [[name.replace('\0', ' ') for name in part.split()] for part in (parts[0], prerequisites)]
+
+
+def parse_dep_file(path, build_dir):
+    """Parse a compiler generated make dependency file. Returns a list of (targets, prerequisites).
+
+    Prerequisites are returned as real paths, targets as written, since they are passed to make.
+    """
+    with open(path) as f:
+        text = f.read().replace('\\\n', ' ')
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        rule = _split_rule(line)
+        if rule is None or not rule[1]:
+            # "header.h:" rules generated by -MP have no prerequisites
+            continue
+        targets, prerequisites = rule
+        rules.append((targets, [os.path.realpath(os.path.join(build_dir, name)) for name in prerequisites]))
+    return rules
+
+
+def parse_make_database(text, build_dir):
+    """Parse the file rules of the database printed by 'make -p'. Returns a tuple (rules, phony).
+
+    'rules' is a list of (targets, prerequisites) as returned by parse_dep_file(), 'phony' the set of
+    phony targets.
+    """
+    rules = []
+    phony = set()
+    in_files = False
+    not_a_target = False
+    for line in text.splitlines():
+        if line.startswith('# Files'):
+            in_files = True
+        elif line.startswith('# files hash-table stats'):
+            break
+        elif not in_files:
+            continue
+        elif line == '# Not a target:':
+            # files make only looked at, and suffix rules
+            not_a_target = True
+        elif line and not line.startswith(('#', '\t', ' ')):
+            rule = None if not_a_target else _split_rule(line)
+            not_a_target = False
+            if rule is None or not rule[1]:
+                continue
+            targets, prerequisites = rule
+            if targets == ['.PHONY']:
+                phony.update(prerequisites)
+            else:
+                rules.append((targets, [os.path.realpath(os.path.join(build_dir, name)) for name in prerequisites]))
+    return rules, phony
+
+
+def read_make_database(command, build_dir):
+    """Run 'command', which prints the make database without building anything, and parse its output.
+
+    Returns the result of parse_make_database(), None if make failed.
+    """
+    try:
+        process = subprocess.run(command, cwd=build_dir, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    # "make -q" exits with 1 if the goal is out of date
+    if process.returncode not in (0, 1):
+        return None
+    return parse_make_database(process.stdout.decode('utf-8', 'replace'), build_dir)
+
+
+def update_dep_index(build_dir):
+    """Return the map of prerequisite paths to the make targets depending on them.
+
+    The parsed dependency files are cached in the build directory, only new and changed
+    dependency files are parsed again.
+    """
+    index_path = os.path.join(build_dir, DEP_INDEX_FILE)
+    try:
+        with open(index_path) as f:
+            cached = json.load(f)
+        if cached.get('version') != _DEP_INDEX_VERSION:
+            cached = {}
+    except (IOError, OSError, ValueError):
+        cached = {}
+    cached_files = cached.get('files', {})
+
+    files = {}
+    for path, rel_path in walk_files(build_dir):
+        if not path.endswith('.d') or not os.path.isfile(path):
+            continue
+        st = os.stat(path)
+        entry = cached_files.get(rel_path)
+        if entry is None or entry['size'] != st.st_size or entry['mtime_ns'] != st.st_mtime_ns:
+            entry = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'rules': parse_dep_file(path, build_dir)}
+        files[rel_path] = entry
+
+    if files != cached_files:
+        write_atomic(index_path, json.dumps({'version': _DEP_INDEX_VERSION, 'files': files}))
+
+    reverse_index = {}
+    for entry in files.values():
+        for targets, prerequisites in entry['rules']:
+            for prerequisite in prerequisites:
+                reverse_index.setdefault(prerequisite, set()).update(targets)
+    return reverse_index
+
+
+def affected_targets(build_dir, changed, database=None):
+    """Map the changed files to the make targets depending on them.
+
+    Without 'database', the targets are the ones of the dependency files, usually objects. With
+    'database', the result of parse_make_database(), the targets are followed through the make rules
+    and only the last affected file targets, e.g. linked binaries, are returned. Building them rebuilds
+    everything else affected.
+
+    Returns a tuple (targets, unmapped), where 'unmapped' lists the changed build inputs which aren't in
+    any dependency file or make rule. These are new sources or makefiles, whose effect can't be determined without
+    a full build.
+    """
+    reverse_index = update_dep_index(build_dir)
+    if database is not None:
+        rules, phony = database
+        for rule_targets, prerequisites in rules:
+            file_targets = [target for target in rule_targets if target not in phony]
+            for prerequisite in prerequisites:
+                reverse_index.setdefault(prerequisite, set()).update(file_targets)
+
+    targets = set()
+    unmapped = []
+    for path in changed:
+        if path in reverse_index:
+            targets.update(reverse_index[path])
+        elif any(fnmatch.fnmatch(os.path.basename(path), p) for p in AFFECTED_BUILD_FILES):
+            unmapped.append(path)
+    if database is None:
+        return sorted(targets), unmapped
+
+    def dependents(target):
+        return reverse_index.get(os.path.realpath(os.path.join(build_dir, target)), set())
+
+    pending = list(targets)
+    while pending:
+        for dependent in dependents(pending.pop()):
+            if dependent not in targets:
+                targets.add(dependent)
+                pending.append(dependent)
+    return sorted(target for target in targets if not dependents(target) & targets), unmapped
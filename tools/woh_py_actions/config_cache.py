@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+
+from .errors import FatalError
+from .tools import write_atomic
+
+CONFIG_DIR = '.woh_config'
+CONFIG_CACHE_FILE = 'woh_config.json'
+# One stamp file per key, touched only when the value of that key changes or the key is removed.
+# Make rules depend on $(WOH_CONFIG_DIR)/keys/<KEY> to rebuild only on changes of that key.
+CONFIG_KEYS_DIR = 'keys'
+
+_KEY_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def config_dir(build_dir):
+    return os.path.join(build_dir, CONFIG_DIR)
+
+
+def _value_hash(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def parse_cache_entries(entries):
+    """Parse the KEY=VALUE strings given with -D/--define-cache-entry."""
+    parsed = OrderedDict()
+    for entry in entries:
+        key, sep, value = entry.partition('=')
+        key = key.strip()
+        if not sep or not _KEY_RE.match(key):
+            raise FatalError('Invalid cache entry "%s". Use -D KEY=VALUE, KEY must be a valid make variable name.'
+                             % entry)
+        parsed[key] = value
+    return parsed
+
+
+def load_config_cache(build_dir):
+    path = os.path.join(config_dir(build_dir), CONFIG_CACHE_FILE)
+    if not os.path.exists(path):
+        return OrderedDict()
+    try:
+        with open(path) as f:
+            return json.load(f, object_pairs_hook=OrderedDict)
+    except ValueError:
+        raise FatalError('Configuration cache %s is corrupted. Delete it to start again.' % path)
+
+
+def _write_if_changed(path, content):
+    """Write 'content' to 'path' only if it differs, so make sees a new timestamp only on real changes."""
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == content:
+                return False
+    write_atomic(path, content)
+    return True
+
+
+def update_config_cache(build_dir, entries, removed_keys=()):
+    """Merge 'entries' into the configuration cache of 'build_dir' and drop 'removed_keys' from it.
+
+    Returns the merged cache and a list of (key, old_value, new_value) tuples for changed keys,
+    new_value is None for removed keys.
+    """
+    cache = load_config_cache(build_dir)
+    changes = []
+    removed = []
+    for key in removed_keys:
+        if not _KEY_RE.match(key):
+            raise FatalError('Invalid cache entry name "%s". Use -U KEY.' % key)
+        if key in cache:
+            changes.append((key, cache.pop(key)['value'], None))
+            removed.append(key)
+    for key, value in parse_cache_entries(entries).items():
+        old = cache.get(key)
+        value_hash = _value_hash(value)
+        if old is not None and old['hash'] == value_hash:
+            continue
+        changes.append((key, old['value'] if old is not None else None, value))
+        cache[key] = OrderedDict([('value', value), ('hash', value_hash)])
+
+    keys_dir = os.path.join(config_dir(build_dir), CONFIG_KEYS_DIR)
+    if not os.path.isdir(keys_dir):
+        os.makedirs(keys_dir)
+    for key, entry in cache.items():
+        _write_if_changed(os.path.join(keys_dir, key), entry['hash'] + '\n')
+    # the stamp of a removed key is kept, rules depending on it still rebuild once
+    for key in removed:
+        _write_if_changed(os.path.join(keys_dir, key), 'unset\n')
+
+    # generated files, keep them out of the project's git status
+    gitignore = os.path.join(config_dir(build_dir), '.gitignore')
+    if not os.path.exists(gitignore):
+        write_atomic(gitignore, '*\n')
+    _write_if_changed(os.path.join(config_dir(build_dir), CONFIG_CACHE_FILE), json.dumps(cache, indent=4) + '\n')
+    return cache, changes
+
+
+def print_config_changes(changes):
+    if not changes:
+        return
+    print('Configuration cache changes:')
+    for key, old, new in changes:
+        if old is None:
+            print('    + %s=%s' % (key, new))
+        elif new is None:
+            print('    - %s' % key)
+        else:
+            print('    ~ %s: %s -> %s' % (key, old, new))
+
+
+def make_variables(build_dir, cache):
+    """Return the make command line variables exposing the configuration cache."""
+    return ['WOH_CONFIG_DIR=%s' % config_dir(build_dir)] + ['%s=%s' % (key, entry['value'])
+                                                           for key, entry in cache.items()]
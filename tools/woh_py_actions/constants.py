@@ -3,18 +3,48 @@ import multiprocessing
 
 MAKE_CMD = 'make'
 MAKE_GENERATOR = 'Unix Makefiles'
+MAKE_JOBS = multiprocessing.cpu_count() + 2
 
 GENERATORS = collections.OrderedDict([
     # - command: build command line
+    # - jobserver_command: build command line when the number of jobs is given by a shared jobserver
     # - version: version command line
     # - verbose_flag: verbose flag
+    # - database: command line printing the rules of the build system without building anything
     (MAKE_GENERATOR, {
-        'command': [MAKE_CMD, '-j', str(multiprocessing.cpu_count() + 2)],
+        'command': [MAKE_CMD, '-j', str(MAKE_JOBS)],
+        'jobserver_command': [MAKE_CMD],
         'version': [MAKE_CMD, '--version'],
         'dry_run': [MAKE_CMD, '-n'],
         'verbose_flag': 'VERBOSE=1',
+        'database': [MAKE_CMD, '-p', '-q'],
     })
 ])
 
 SUPPORTED_TARGETS = ['default', 'openwrt_6ul']
 PREVIEW_TARGETS = ['linux']
+
+# Final build artifacts, e.g. firmware images
+ARTIFACT_PATTERNS = ['*.bin', '*.elf', '*.hex', '*.img']
+
+# Test binaries run by the 'test' action
+TEST_PATTERNS = ['test_*', '*_test']
+
+# Default outputs of the 'test' and 'package' actions in the build directory
+TEST_REPORT_FILE = 'test_results.xml'
+PACKAGE_DIR = 'package'
+
+# Build outputs kept in build directory snapshots (matched against the file name). Anything else in the
+# build directory, e.g. .config or editor settings ignored by git, may be a user file and is never touched.
+SNAPSHOT_PATTERNS = ARTIFACT_PATTERNS + ['*.o', '*.obj', '*.d', '*.a', '*.so', '*.so.[0-9]*', '*.map']
+
+# Build inputs which require a full build when changed and not listed in any dependency file
+AFFECTED_BUILD_FILES = ['Makefile', 'makefile', 'GNUmakefile', '*.mk', '*.c', '*.cc', '*.cpp', '*.cxx', '*.h', '*.hh',
+                        '*.hpp', '*.S', '*.s', '*.ld']
+
+# Files copied back from a RAM-backed build directory (matched against the relative path and the file name)
+RAM_BUILD_SYNC_PATTERNS = ARTIFACT_PATTERNS + [
+    '*.map', '*.a', '*.so', '*.d', '.woh_config/*', 'package/*', '.woh_test_cache.json', 'test_results.xml',
+    '.woh_depindex.json']
+# Version control directories, never walked when looking for build files
+VCS_DIRS = ['.git', '.svn', '.hg']
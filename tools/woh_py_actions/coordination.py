@@ -0,0 +1,198 @@
+import errno
+import fcntl
+import json
+import os
+import stat
+import tempfile
+import time
+
+from .errors import FatalError
+from .tools import write_atomic
+
+BUILD_LOCK_FILE = '.woh.lock'
+BUILD_STATE_FILE = '.woh.lock.json'
+
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+
+LOCK_POLL_INTERVAL = 0.1
+
+
+class BuildDirLock(object):
+    """Lock of a build directory shared by all woh.py invocations using it.
+
+    Mutating runs hold the lock exclusively, read-only runs share it. The exclusive holder records
+    what it builds in BUILD_STATE_FILE, so a run waiting for it with the same request can reuse
+    its result instead of building again.
+    """
+
+    def __init__(self, build_dir):
+        self.build_dir = build_dir
+        self.state_path = os.path.join(build_dir, BUILD_STATE_FILE)
+        self._file = None
+        self._handed_over = False
+        self.exclusive = False
+
+    def read_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write_state(self, state):
+        write_atomic(self.state_path, json.dumps(state))
+
+    def _wait(self, operation, timeout):
+        if timeout is None:
+            fcntl.flock(self._file, operation)
+            return
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fcntl.flock(self._file, operation | fcntl.LOCK_NB)
+                return
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+            if time.time() >= deadline:
+                self._file.close()
+                self._file = None
+                raise FatalError('Build directory %s is still used by another woh.py run after %d seconds.' %
+                                 (self.build_dir, timeout))
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def acquire(self, request, exclusive=True, timeout=None):
+        """Lock the build directory for 'request', waiting for a concurrent run if needed.
+
+        Waits at most 'timeout' seconds, forever if it is None.
+        Returns the state of a concurrent run with the same request which succeeded while this
+        run was waiting for it, None if the request has to be executed.
+        """
+        if not os.path.isdir(self.build_dir):
+            os.makedirs(self.build_dir)
+        self._file = open(os.path.join(self.build_dir, BUILD_LOCK_FILE), 'a')
+        self.exclusive = exclusive
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+        awaited = None
+        try:
+            fcntl.flock(self._file, operation | fcntl.LOCK_NB)
+        except (IOError, OSError) as e:
+            if e.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            state = self.read_state()
+            if state.get('status') == RUNNING:
+                print('Waiting for the woh.py run (pid %s) using build directory %s...' %
+                      (state.get('pid'), self.build_dir))
+                if state.get('request') == request:
+                    awaited = state
+            else:
+                print('Waiting for the lock of build directory %s...' % self.build_dir)
+            self._wait(operation, timeout)
+
+        if awaited is not None:
+            state = self.read_state()
+            if state.get('started') == awaited.get('started') and state.get('status') == SUCCEEDED:
+                return state
+
+        if exclusive:
+            self._write_state({'pid': os.getpid(), 'request': request, 'started': time.time(), 'status': RUNNING})
+        return None
+
+    def succeeded(self):
+        if not self.exclusive:
+            return
+        state = self.read_state()
+        if state.get('pid') == os.getpid():
+            state.update(status=SUCCEEDED, finished=time.time())
+            self._write_state(state)
+
+    def hand_over(self):
+        """Keep the lock held by a child process after this run exits. Returns the file descriptor to pass to it.
+
+        The lock belongs to the open lock file, so it is held until the child closes its copy of it.
+        """
+        self._handed_over = True
+        return self._file.fileno()
+
+    def release(self):
+        if self._file is not None:
+            if not self._handed_over:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def job_pool_dir():
+    return os.path.join(tempfile.gettempdir(), 'woh-%d' % os.getuid())
+
+
+class JobPool(object):
+    """Host-wide pool of make job tokens, shared by all concurrent woh.py runs of the user.
+
+    The tokens are kept in a named pipe passed to make as its jobserver. The pipe keeps its contents
+    only while it is open, so the first run to open it fills it with the tokens, and every run keeps
+    it open until it exits.
+    """
+
+    def __init__(self, size, path=None):
+        self.size = size
+        self.path = path or job_pool_dir()
+        self.fd = None
+        self._users = None
+
+    def open(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, 0o700)
+        fifo = os.path.join(self.path, 'jobserver.fifo')
+        with open(os.path.join(self.path, 'jobserver.init'), 'a') as init_lock:
+            # held while a run opens the pool, so it can't be filled twice
+            fcntl.flock(init_lock, fcntl.LOCK_EX)
+            if not os.path.exists(fifo):
+                os.mkfifo(fifo, 0o600)
+            elif not stat.S_ISFIFO(os.stat(fifo).st_mode):
+                raise FatalError('%s is not a named pipe. Remove it to use the shared job pool.' % fifo)
+            self.fd = os.open(fifo, os.O_RDWR)
+
+            self._users = open(os.path.join(self.path, 'jobserver.users'), 'a')
+            try:
+                fcntl.flock(self._users, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                first_user = True
+            except (IOError, OSError):
+                first_user = False
+            if first_user:
+                self._fill(fifo)
+            fcntl.flock(self._users, fcntl.LOCK_SH)
+
+    def _fill(self, fifo):
+        fd = os.open(fifo, os.O_RDWR | os.O_NONBLOCK)
+        try:
+            while True:
+                try:
+                    if not os.read(fd, 4096):
+                        break
+                except (IOError, OSError) as e:
+                    if e.errno == errno.EAGAIN:
+                        break
+                    raise
+            # every make owns one implicit token besides those in the pool
+            os.write(fd, b'+' * max(self.size - 1, 0))
+        finally:
+            os.close(fd)
+
+    def make_env(self, env):
+        """Return the environment making make use the pool as its jobserver."""
+        makeflags = ' '.join(filter(None, [env.get('MAKEFLAGS', os.environ.get('MAKEFLAGS', '')),
+                                           '-j --jobserver-auth=%d,%d' % (self.fd, self.fd)]))
+        env = dict(env)
+        env['MAKEFLAGS'] = makeflags
+        return env
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self._users is not None:
+            self._users.close()
+            self._users = None
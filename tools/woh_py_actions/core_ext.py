@@ -1,3 +1,4 @@
+import json
 import os
 import subprocess
 import sys
@@ -7,13 +8,43 @@ import click
 
 from woh_py_actions.tools import (ensure_build_directory, woh_version, merge_action_lists, realpath, run_target)
 from woh_py_actions.errors import FatalError
-from woh_py_actions.constants import GENERATORS
+from woh_py_actions.affected import affected_targets, changed_files, read_make_database
+from woh_py_actions.config_cache import make_variables
+from woh_py_actions.constants import GENERATORS, MAKE_JOBS, PACKAGE_DIR, TEST_REPORT_FILE
+from woh_py_actions.coordination import BuildDirLock, JobPool
 from woh_py_actions.global_options import global_options
+from woh_py_actions.ram_build import prepare_ram_build_dir, release_ram_build_dir, sync_back
+from woh_py_actions.snapshots import (SnapshotStore, default_snapshot_dir, git_tree_hash, git_worktree_clean,
+                                      read_snapshot_key, restore_snapshot, start_background_snapshot,
+                                      write_snapshot_key)
 
 def action_extensions(base_action, project_path):
-    def build_target(target_name, ctx, args):
+    def build_target(target_name, ctx, args, affected=False, affected_since=None, changed_file=(), list_affected=False):
         """Execute the target build system to build target 'target_name'"""
         ensure_build_directory(args, ctx.info_name)
+        if affected or affected_since or changed_file or list_affected:
+            changed = ([realpath(path) for path in changed_file] or
+                       changed_files(args.project_dir, affected_since or 'HEAD'))
+            database = read_make_database(GENERATORS[args.generator]['database'] +
+                                          make_variables(args.build_dir, args.config_cache) + [target_name],
+                                          args.build_dir)
+            targets, unmapped = affected_targets(args.build_dir, changed, database)
+            if unmapped:
+                print('Changed build inputs not found in any dependency file, building everything:\n    %s' %
+                      '\n    '.join(unmapped))
+                targets = [target_name]
+            elif database is None and targets:
+                # the objects alone don't relink the binaries using them
+                print('Cannot read the make database, building %s after the affected objects.' % target_name)
+                targets.append(target_name)
+            if list_affected:
+                print('Affected targets:\n    %s' % '\n    '.join(targets) if targets else 'No affected targets.')
+                return
+            if not targets:
+                print('No build targets are affected by %d changed file(s).' % len(changed))
+                return
+            run_target(targets, args)
+            return
         run_target(target_name, args)
 
     def set_target(action, ctx, args, idf_target):
@@ -70,6 +101,117 @@ def action_extensions(base_action, project_path):
             args.build_dir = os.path.join(args.project_dir, './')
         args.build_dir = realpath(args.build_dir)
 
+    def read_only_tasks(ctx, tasks):
+        """Return True if neither 'tasks' nor the actions they depend on change the build directory."""
+        given = dict((task.name, task) for task in tasks)
+        pending = list(tasks)
+        seen = set()
+        while pending:
+            task = pending.pop()
+            if task.name in seen:
+                continue
+            seen.add(task.name)
+            if not task.is_read_only():
+                return False
+            # dependencies not given on the command line run with their default options
+            pending.extend(given.get(dep) or ctx.invoke(ctx.command.get_command(ctx, dep))
+                           for dep in task.dependencies)
+        return True
+
+    def lock_build_directory(ctx, args, tasks):
+        args.read_only = read_only_tasks(ctx, tasks)
+        if not tasks or args.dry_run:
+            return
+        # what a concurrent run has to be asked for so that its result can be reused
+        request = json.loads(json.dumps({
+            'tasks': [[task.name, task.action_args] for task in tasks],
+            'define_cache_entry': args.define_cache_entry,
+            'undefine_cache_entry': args.undefine_cache_entry,
+        }, sort_keys=True, default=str))
+        lock = BuildDirLock(args.build_dir)
+        ctx.call_on_close(lock.release)
+        reused = lock.acquire(request, exclusive=not args.read_only, timeout=args.lock_timeout)
+        args.build_dir_lock = lock
+        if reused:
+            print('The same actions were just completed by the woh.py run with pid %s, reusing its result.' %
+                  reused['pid'])
+            ctx.exit()
+
+        if not args.no_shared_jobs:
+            job_pool = JobPool(MAKE_JOBS)
+            job_pool.open()
+            ctx.call_on_close(job_pool.close)
+            args.job_pool = job_pool
+
+    def mark_build_succeeded(ctx, args, tasks):
+        if 'build_dir_lock' in args:
+            args.build_dir_lock.succeeded()
+
+    def woh_outputs(build_dir):
+        # written by woh.py itself, they don't make the work tree differ from the commit
+        return [os.path.join(build_dir, TEST_REPORT_FILE), os.path.join(build_dir, PACKAGE_DIR)]
+
+    def restore_build_snapshot(ctx, args, tasks):
+        if not args.snapshots or args.dry_run or args.read_only:
+            return
+        key = git_tree_hash(args.project_dir)
+        if key is None or read_snapshot_key(args.build_dir) == key:
+            return
+        store = SnapshotStore(realpath(args.snapshot_dir or default_snapshot_dir()))
+        if not store.has_snapshot(key):
+            return
+        if not git_worktree_clean(args.project_dir, woh_outputs(args.build_dir)):
+            print('Not restoring the build snapshot of git tree %s, the work tree has changes not committed to git.'
+                  % key)
+            return
+        if not os.path.isdir(args.build_dir):
+            os.makedirs(args.build_dir)
+        restored = restore_snapshot(store, args.project_dir, args.build_dir, key)
+        write_snapshot_key(args.build_dir, key)
+        print('Restored %d file(s) from the build snapshot of git tree %s' % (restored, key))
+
+    def save_build_snapshot(ctx, args, tasks):
+        if not args.snapshots or 'all' not in tasks or args.dry_run or args.read_only:
+            return
+        build_args = tasks['all'].action_args
+        if build_args.get('list_affected'):
+            return
+        if build_args.get('affected') or build_args.get('affected_since') or build_args.get('changed_file'):
+            # other outputs may be left from another tree, don't let them be mistaken for this one
+            print('Not saving a build snapshot, only the affected targets were built.')
+            write_snapshot_key(args.persistent_build_dir, None)
+            return
+        key = git_tree_hash(args.project_dir)
+        if key is None or not git_worktree_clean(args.project_dir, woh_outputs(args.persistent_build_dir)):
+            # the build doesn't match any commit, don't let it be mistaken for one
+            if key is not None:
+                print('Not saving a build snapshot, the work tree has changes not committed to git.')
+            write_snapshot_key(args.persistent_build_dir, None)
+            return
+        write_snapshot_key(args.persistent_build_dir, key)
+        store_dir = realpath(args.snapshot_dir or default_snapshot_dir())
+        SnapshotStore(store_dir)
+        start_background_snapshot(store_dir, args.project_dir, args.persistent_build_dir, key,
+                                  args.snapshot_budget * 1024 * 1024, args.build_dir_lock)
+        print('Saving the build snapshot of git tree %s in the background' % key)
+
+    def setup_ram_build(ctx, args, tasks):
+        args.persistent_build_dir = args.build_dir
+        if not args.ram_build or args.dry_run or args.read_only:
+            return
+        ram_dir = prepare_ram_build_dir(args.build_dir, args.ram_build_dir and realpath(args.ram_build_dir))
+        args.build_dir = ram_dir
+        # reclaim the memory also when the build fails
+        ctx.call_on_close(lambda: release_ram_build_dir(ram_dir))
+
+    def finish_ram_build(ctx, args, tasks):
+        if args.build_dir == args.persistent_build_dir:
+            return
+        synced, removed = sync_back(args.build_dir, args.persistent_build_dir)
+        print('Synced %d file(s) from RAM build directory back to %s, removed %d file(s)' %
+              (len(synced), args.persistent_build_dir, len(removed)))
+        release_ram_build_dir(args.build_dir)
+
     root_options = {
         'global_options': [
             {
@@ -92,6 +234,70 @@ def action_extensions(base_action, project_path):
                 'type': click.Path(),
                 'default': None,
             },
+            {
+                'names': ['--ram-build'],
+                'help': ('Build in a RAM-backed copy of the build directory, seeded from the build directory. '
+                         'Only artifacts and dependency files are synced back after a successful build.'),
+                'is_flag': True,
+                'default': False,
+            },
+            {
+                'names': ['--ram-build-dir'],
+                'help': 'Parent directory for the RAM-backed build directory. Default is /dev/shm.',
+                'type': click.Path(),
+                'default': None,
+            },
+            {
+                'names': ['--snapshots'],
+                'help': ('Keep snapshots of the build directory for each built git tree, and restore the matching '
+                         'snapshot before building a tree that was built before.'),
+                'is_flag': True,
+                'default': False,
+            },
+            {
+                'names': ['--snapshot-dir'],
+                'help': 'Directory with the build snapshots. Default is ~/.cache/woh/snapshots.',
+                'type': click.Path(),
+                'default': None,
+            },
+            {
+                'names': ['--snapshot-budget'],
+                'help': 'Storage budget of the build snapshots in MB. Least recently used snapshots are evicted.',
+                'type': int,
+                'default': 4096,
+            },
+            {
+                'names': ['--no-shared-jobs'],
+                'help': ('Run make with its own jobs instead of drawing job tokens from the pool shared by all '
+                         'woh.py runs on this host.'),
+                'is_flag': True,
+                'default': False,
+            },
+            {
+                'names': ['--lock-timeout'],
+                'help': ('Give up after waiting this many seconds for another woh.py run using the build directory. '
+                         '0 fails at once, the default is to wait until it finishes.'),
+                'type': int,
+                'default': None,
+            },
+            {
+                'names': ['--action-timeout'],
+                'help': 'Stop a build tool run which takes longer than this many seconds.',
+                'type': int,
+                'default': None,
+            },
+            {
+                'names': ['--max-memory'],
+                'help': 'Limit the address space of each process started by the build tool, in MB.',
+                'type': int,
+                'default': None,
+            },
+            {
+                'names': ['--max-cpu-time'],
+                'help': 'Limit the CPU time of each process started by the build tool, in seconds.',
+                'type': int,
+                'default': None,
+            },
             {
                 'names': ['-G', '--generator'],
                 'help': 'CMake generator.',
@@ -113,7 +319,10 @@ def action_extensions(base_action, project_path):
                 'default': False,
             },
         ],
-        'global_action_callbacks': [validate_root_options],
+        'global_action_callbacks': [
+            validate_root_options, lock_build_directory, restore_build_snapshot, setup_ram_build],
+        # the build directory lock is handed over to the snapshot process, mark the build as done before
+        'global_action_finalizers': [finish_ram_build, mark_build_succeeded, save_build_snapshot],
     }
 
     build_actions = {
@@ -125,7 +334,34 @@ def action_extensions(base_action, project_path):
                 'help': (
                     'Build the woh project.'
                 ),
-                # 'options': global_options,
+                'options': global_options + [
+                    {
+                        'names': ['--affected'],
+                        'help': ('Build only the targets affected by the files changed in the git work tree. '
+                                 'Targets are found from the dependency files in the build directory and the '
+                                 'make rules.'),
+                        'is_flag': True,
+                        'default': False,
+                    },
+                    {
+                        'names': ['--affected-since'],
+                        'help': 'Build only the targets affected by the files changed since git revision REV.',
+                        'metavar': 'REV',
+                        'default': None,
+                    },
+                    {
+                        'names': ['--changed-file'],
+                        'help': 'Build only the targets affected by this file. Can be given multiple times.',
+                        'type': click.Path(),
+                        'multiple': True,
+                    },
+                    {
+                        'names': ['--list-affected'],
+                        'help': 'List the targets affected by the changed files instead of building them.',
+                        'is_flag': True,
+                        'default': False,
+                    },
+                ],
                 'order_dependencies': [
                     'reconfigure',
                     'clean',
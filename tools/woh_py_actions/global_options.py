@@ -3,4 +3,9 @@ global_options = [{
     'help': 'Create a cache entry.',
     'scope': 'global',
     'multiple': True,
+}, {
+    'names': ['-U', '--undefine-cache-entry'],
+    'help': 'Remove a cache entry.',
+    'scope': 'global',
+    'multiple': True,
 }]
\ No newline at end of file
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+
+import click
+
+from woh_py_actions.constants import ARTIFACT_PATTERNS, PACKAGE_DIR
+from woh_py_actions.packaging import COMPRESSIONS, find_artifacts, package_artifacts
+from woh_py_actions.tools import ensure_build_directory
+
+
+def action_extensions(base_action, project_path):
+    def package(action, ctx, args, compression, jobs, output_dir, artifact):
+        """Compress and checksum the build artifacts and bundle them with a manifest."""
+        ensure_build_directory(args, ctx.info_name)
+        output_dir = os.path.join(args.build_dir, output_dir or PACKAGE_DIR)
+        patterns = artifact or ARTIFACT_PATTERNS
+        artifacts = find_artifacts(args.build_dir, patterns, exclude_dirs=[output_dir])
+        archive_path = os.path.join(output_dir, '%s.tar' % os.path.basename(args.project_dir.rstrip(os.sep)))
+
+        manifest = package_artifacts(args.build_dir, artifacts, output_dir, archive_path, compression, jobs)
+        for entry in manifest['artifacts']:
+            print('%s %s (%d -> %d bytes)' % (entry['sha256'], entry['name'], entry['size'], entry['compressed_size']))
+        print('Package written to %s' % archive_path)
+
+    package_actions = {
+        'actions': {
+            'package': {
+                'callback': package,
+                'short_help': 'Package the build artifacts with checksums.',
+                'help': (
+                    'Compress and checksum the build artifacts in one pass per artifact, processing '
+                    'artifacts in parallel. Writes a reproducible tar archive and a JSON manifest to '
+                    'the output directory.'
+                ),
+                'dependencies': ['all'],
+                'options': [
+                    {
+                        'names': ['--compression'],
+                        'help': 'Compression of the packaged artifacts.',
+                        'type': click.Choice(COMPRESSIONS.keys()),
+                        'default': 'xz',
+                    },
+                    {
+                        'names': ['--jobs'],
+                        'help': 'Number of artifacts processed in parallel.',
+                        'type': int,
+                        'default': multiprocessing.cpu_count(),
+                    },
+                    {
+                        'names': ['--output-dir'],
+                        'help': "Output directory, relative to the build directory. Default is 'package'.",
+                        'type': click.Path(),
+                        'default': None,
+                    },
+                    {
+                        'names': ['--artifact'],
+                        'help': 'File name pattern of artifacts to package. Can be given multiple times.',
+                        'multiple': True,
+                    },
+                ],
+            },
+        },
+    }
+
+    return package_actions
@@ -0,0 +1,141 @@
+import fnmatch
+import hashlib
+import io
+import json
+import lzma
+import mmap
+import os
+import tarfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .errors import FatalError
+from .tools import walk_files
+
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_NAME = 'manifest.json'
+
+COMPRESSIONS = OrderedDict([
+    # - suffix: appended to the artifact name
+    # - compressor: factory of an object with compress() and flush(), None to store the data as is
+    ('xz', {
+        'suffix': '.xz',
+        'compressor': lambda: lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=6),
+    }),
+    ('gz', {
+        # wbits=31 writes a gzip header with zero timestamp, which keeps the output reproducible
+        'suffix': '.gz',
+        'compressor': lambda: zlib.compressobj(9, zlib.DEFLATED, 31),
+    }),
+    ('none', {
+        'suffix': '',
+        'compressor': None,
+    }),
+])
+
+
+def find_artifacts(build_dir, patterns, exclude_dirs=()):
+    """Return the sorted paths of files in 'build_dir' matching any of 'patterns', relative to 'build_dir'."""
+    artifacts = []
+    for path, rel_path in walk_files(build_dir, exclude_dirs):
+        if any(fnmatch.fnmatch(os.path.basename(path), p) for p in patterns):
+            artifacts.append(rel_path)
+    return sorted(artifacts)
+
+
+def _chunks(path):
+    """Yield the contents of 'path' in chunks, reading it once through mmap."""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, len(view), CHUNK_SIZE):
+                    chunk = view[offset:offset + CHUNK_SIZE]
+                    yield chunk
+                    # the map cannot be closed while any slice of it is still exported
+                    chunk.release()
+            finally:
+                view.release()
+
+
+def package_artifact(build_dir, name, output_dir, compression):
+    """Checksum and compress one artifact in a single streaming pass. Returns its manifest entry."""
+    settings = COMPRESSIONS[compression]
+    compressor = settings['compressor']() if settings['compressor'] else None
+    output_name = name + settings['suffix']
+    output_path = os.path.join(output_dir, output_name)
+    if not os.path.isdir(os.path.dirname(output_path)):
+        os.makedirs(os.path.dirname(output_path))
+
+    sha256 = hashlib.sha256()
+    compressed_sha256 = hashlib.sha256()
+    size = 0
+    compressed_size = 0
+    with open(output_path, 'wb') as output:
+        def write(data):
+            output.write(data)
+            compressed_sha256.update(data)
+            return len(data)
+
+        for chunk in _chunks(os.path.join(build_dir, name)):
+            sha256.update(chunk)
+            size += len(chunk)
+            compressed_size += write(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            compressed_size += write(compressor.flush())
+
+    return OrderedDict([
+        ('name', name.replace(os.sep, '/')),
+        ('size', size),
+        ('sha256', sha256.hexdigest()),
+        ('file', output_name.replace(os.sep, '/')),
+        ('compressed_size', compressed_size),
+        ('compressed_sha256', compressed_sha256.hexdigest()),
+    ])
+
+
+def _add_to_archive(archive, name, fileobj, size):
+    # fixed metadata so that the same inputs always produce the same archive
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = 0
+    info.mode = 0o644
+    info.uid = info.gid = 0
+    info.uname = info.gname = ''
+    archive.addfile(info, fileobj)
+
+
+def package_artifacts(build_dir, artifacts, output_dir, archive_path, compression='xz', jobs=None):
+    """Package 'artifacts' in parallel and write a reproducible tar archive with a JSON manifest.
+
+    Returns the manifest.
+    """
+    if compression not in COMPRESSIONS:
+        raise FatalError('Unknown compression "%s"' % compression)
+    if not artifacts:
+        raise FatalError('No build artifacts found in %s' % build_dir)
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+
+    # zlib, lzma and hashlib release the GIL while working on large buffers
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        entries = list(executor.map(lambda name: package_artifact(build_dir, name, output_dir, compression),
+                                    artifacts))
+
+    manifest = OrderedDict([
+        ('compression', compression),
+        ('artifacts', sorted(entries, key=lambda entry: entry['name'])),
+    ])
+    manifest_data = (json.dumps(manifest, indent=4) + '\n').encode('utf-8')
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'wb') as f:
+        f.write(manifest_data)
+
+    with tarfile.open(archive_path, 'w', format=tarfile.GNU_FORMAT) as archive:
+        _add_to_archive(archive, MANIFEST_NAME, io.BytesIO(manifest_data), len(manifest_data))
+        for entry in manifest['artifacts']:
+            with open(os.path.join(output_dir, entry['file']), 'rb') as f:
+                _add_to_archive(archive, entry['file'], f, entry['compressed_size'])
+    return manifest
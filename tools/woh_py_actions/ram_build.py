@@ -0,0 +1,179 @@
+import errno
+import fnmatch
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from .affected import DEP_INDEX_FILE
+from .constants import RAM_BUILD_SYNC_PATTERNS
+from .errors import FatalError
+from .tools import replace_file, walk_files
+
+# FICLONE ioctl from linux/fs.h, creates a copy-on-write clone of a whole file
+_FICLONE = 0x40049409
+
+# Files recording absolute paths in the build directory, rewritten for the directory they are copied to
+_PATH_FILE_PATTERNS = ['*.d', DEP_INDEX_FILE]
+
+
+def default_ram_root():
+    """Return the default parent directory for RAM-backed build directories."""
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return tempfile.gettempdir()
+
+
+def ram_build_path(build_dir, ram_root=None):
+    """Return the RAM-backed directory used for the persistent build directory 'build_dir'."""
+    ram_root = ram_root or default_ram_root()
+    digest = hashlib.sha1(build_dir.encode('utf-8')).hexdigest()[:12]
+    return os.path.join(ram_root, 'woh-build-%s-%s' % (os.path.basename(build_dir.rstrip(os.sep)), digest))
+
+
+def _same_file_state(src, dst):
+    try:
+        src_stat = os.lstat(src)
+        dst_stat = os.lstat(dst)
+    except OSError:
+        return False
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+def _clone_file(src, dst):
+    """Copy 'src' to 'dst' preserving timestamps, as a copy-on-write clone where the filesystem allows."""
+    try:
+        import fcntl
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+        shutil.copystat(src, dst)
+    except (ImportError, IOError, OSError):
+        shutil.copy2(src, dst)
+
+
+def _rewrite_paths(src, dst, old_dir, new_dir):
+    """Write 'src' to 'dst' with the paths in 'old_dir' changed to 'new_dir', preserving timestamps.
+
+    Returns False if 'dst' already was such a copy.
+    """
+    with open(src, 'rb') as f:
+        data = f.read()
+    # not followed by more of a file name, '/build' must not match '/build2'
+    pattern = re.compile(re.escape(old_dir.encode('utf-8')) + br'(?![\w.-])')
+    data = pattern.sub(new_dir.encode('utf-8').replace(b'\\', b'\\\\'), data)
+    if os.path.isfile(dst) and os.stat(src).st_mtime_ns == os.stat(dst).st_mtime_ns:
+        with open(dst, 'rb') as f:
+            if f.read() == data:
+                return False
+
+    def create(tmp):
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        shutil.copystat(src, tmp)
+    replace_file(dst, create)
+    return True
+
+
+def _copy_back(src, dst, link):
+    """Atomically replace 'dst' with the contents of 'src'."""
+    def create(tmp):
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), tmp)
+            return
+        if link:
+            try:
+                os.link(src, tmp)
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        _clone_file(src, tmp)
+    replace_file(dst, create)
+
+
+def seed_build_directory(build_dir, ram_dir):
+    """Populate 'ram_dir' with the persisted state of 'build_dir'. Returns the number of copied files.
+
+    Files are never hard linked here: compilers rewrite their outputs in place, which would
+    modify the persisted copy through the shared inode.
+    """
+    copied = 0
+    for src, rel_path in walk_files(build_dir):
+        dst = os.path.join(ram_dir, rel_path)
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), dst)
+        elif _should_sync(rel_path, _PATH_FILE_PATTERNS):
+            _rewrite_paths(src, dst, build_dir, ram_dir)
+        else:
+            _clone_file(src, dst)
+        copied += 1
+    return copied
+
+
+def prepare_ram_build_dir(build_dir, ram_root=None):
+    """Create and seed the RAM-backed copy of 'build_dir'. Returns its path.
+
+    A directory left by an earlier run which didn't finish is removed first, its files may be newer
+    than the ones in 'build_dir' without matching them.
+    """
+    ram_dir = ram_build_path(build_dir, ram_root)
+    if not os.path.isdir(os.path.dirname(ram_dir)):
+        raise FatalError('RAM build root %s does not exist' % os.path.dirname(ram_dir))
+    if os.path.lexists(ram_dir):
+        print('Removing the stale RAM build directory %s' % ram_dir)
+        shutil.rmtree(ram_dir)
+    os.makedirs(ram_dir)
+    if os.path.isdir(build_dir):
+        copied = seed_build_directory(build_dir, ram_dir)
+        print('Seeded RAM build directory %s with %d file(s) from %s' % (ram_dir, copied, build_dir))
+    return ram_dir
+
+
+def _should_sync(rel_path, patterns):
+    rel_path = rel_path.replace(os.sep, '/')
+    return any(fnmatch.fnmatch(rel_path, p) or fnmatch.fnmatch(os.path.basename(rel_path), p) for p in patterns)
+
+
+def sync_back(ram_dir, build_dir, patterns=RAM_BUILD_SYNC_PATTERNS):
+    """Copy changed artifacts and dependency files from 'ram_dir' back to 'build_dir'.
+
+    Paths in 'ram_dir' recorded in dependency files are changed to the ones in 'build_dir'.
+    Such files which the build removed from 'ram_dir', e.g. by 'make clean', are removed from 'build_dir'.
+    Returns a tuple (synced, removed) of lists of paths relative to the build directory.
+    """
+    synced = []
+    removed = []
+    link = os.stat(ram_dir).st_dev == os.stat(build_dir).st_dev if os.path.isdir(build_dir) else False
+    for src, rel_path in walk_files(ram_dir):
+        if not _should_sync(rel_path, patterns):
+            continue
+        dst = os.path.join(build_dir, rel_path)
+        rewrite = not os.path.islink(src) and _should_sync(rel_path, _PATH_FILE_PATTERNS)
+        if not rewrite and _same_file_state(src, dst):
+            continue
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+        if rewrite:
+            if not _rewrite_paths(src, dst, ram_dir, build_dir):
+                continue
+        else:
+            # hard links are safe here: the RAM directory is removed once the sync is done
+            _copy_back(src, dst, link)
+        synced.append(rel_path)
+
+    # everything was seeded into the RAM directory, so a missing file was deleted by the build
+    for dst, rel_path in walk_files(build_dir):
+        if _should_sync(rel_path, patterns) and not os.path.lexists(os.path.join(ram_dir, rel_path)):
+            os.remove(dst)
+            removed.append(rel_path)
+    return synced, removed
+
+
+def release_ram_build_dir(ram_dir):
+    """Remove the RAM-backed build directory to reclaim its memory."""
+    shutil.rmtree(ram_dir, ignore_errors=True)
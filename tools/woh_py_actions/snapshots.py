@@ -0,0 +1,316 @@
+import argparse
+import fcntl
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+import zlib
+
+from .config_cache import CONFIG_DIR
+from .constants import SNAPSHOT_PATTERNS
+from .coordination import BUILD_LOCK_FILE, BUILD_STATE_FILE
+from .errors import FatalError
+from .tools import replace_file, walk_files, write_atomic
+
+SNAPSHOT_KEY_FILE = '.woh_snapshot_key'
+SNAPSHOT_STAT_CACHE = '.woh_snapshot_stat.json'
+# replacing the lock file on restore would break the locking of the build directory
+_OWN_FILES = [SNAPSHOT_KEY_FILE, SNAPSHOT_STAT_CACHE, BUILD_LOCK_FILE, BUILD_STATE_FILE]
+
+
+def default_snapshot_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')), 'woh', 'snapshots')
+
+
+def _git(cwd, *args):
+    try:
+        return subprocess.check_output(['git'] + list(args), cwd=cwd, stderr=subprocess.DEVNULL)
+    except (subprocess.CalledProcessError, OSError):
+        return None
+
+
+def git_tree_hash(project_dir):
+    """Return the hash of the git tree checked out in 'project_dir', None if it is not a git work tree."""
+    out = _git(project_dir, 'rev-parse', 'HEAD^{tree}')
+    return out.decode('utf-8').strip() if out else None
+
+
+def git_worktree_clean(project_dir, outputs=()):
+    """Return True if no file in 'project_dir' is modified and git ignores all untracked files.
+
+    Untracked files written by woh.py itself don't count: the .woh* files and the files and
+    directories in 'outputs'.
+    """
+    toplevel = _git_toplevel(project_dir)
+    out = _git(project_dir, 'status', '--porcelain', '-z', '--untracked-files=all')
+    if toplevel is None or out is None:
+        return False
+    outputs = [os.path.realpath(path) for path in outputs]
+    for entry in out.decode('utf-8').split('\0'):
+        if not entry:
+            continue
+        path = os.path.realpath(os.path.join(toplevel, entry[3:]))
+        if entry.startswith('?? ') and (os.path.basename(path).startswith('.woh') or
+                                        any(path == o or path.startswith(o + os.sep) for o in outputs)):
+            continue
+        return False
+    return True
+
+
+def _git_toplevel(path):
+    out = _git(path, 'rev-parse', '--show-toplevel')
+    return os.path.realpath(out.decode('utf-8').strip()) if out else None
+
+
+def is_build_output(rel_path):
+    """Return True if the file 'rel_path', relative to the build directory, is kept in snapshots.
+
+    The configuration cache is left out, it is set by -D and -U rather than by the checked out tree.
+    """
+    return (rel_path.split(os.sep)[0] != CONFIG_DIR and os.path.basename(rel_path) not in _OWN_FILES and
+            any(fnmatch.fnmatch(os.path.basename(rel_path), p) for p in SNAPSHOT_PATTERNS))
+
+
+def snapshot_files(project_dir, build_dir):
+    """Return the paths of the build outputs in 'build_dir' to snapshot, relative to 'build_dir'.
+
+    If the build directory is in the project's git work tree, only files ignored by git are
+    included so that sources are never snapshotted or overwritten on restore.
+    """
+    toplevel = _git_toplevel(project_dir)
+    if toplevel is not None and _git_toplevel(build_dir) == toplevel:
+        out = _git(build_dir, 'ls-files', '-z', '--others', '--ignored', '--exclude-standard')
+        files = [f for f in out.decode('utf-8').split('\0') if f] if out else []
+    else:
+        files = [rel_path for _, rel_path in walk_files(build_dir, [os.path.join(build_dir, CONFIG_DIR)])]
+    return sorted(f for f in files if is_build_output(f) and not os.path.islink(os.path.join(build_dir, f)))
+
+
+class SnapshotStore(object):
+    """Content addressed store of build directory snapshots.
+
+    objects/<sha256> hold the zlib compressed file contents, shared by all snapshots.
+    manifests/<key>.json map the files of one snapshot to their objects.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.objects_dir = os.path.join(path, 'objects')
+        self.manifests_dir = os.path.join(path, 'manifests')
+        for directory in (self.objects_dir, self.manifests_dir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def lock(self):
+        lock_file = open(os.path.join(self.path, 'lock'), 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _object_path(self, sha):
+        return os.path.join(self.objects_dir, sha[:2], sha)
+
+    def _manifest_path(self, key):
+        return os.path.join(self.manifests_dir, '%s.json' % key)
+
+    def has_snapshot(self, key):
+        return os.path.exists(self._manifest_path(key))
+
+    def load_manifest(self, key):
+        with open(self._manifest_path(key)) as f:
+            return json.load(f)
+
+    def save_manifest(self, key, manifest):
+        write_atomic(self._manifest_path(key), json.dumps(manifest, sort_keys=True))
+
+    def has_object(self, sha):
+        return os.path.exists(self._object_path(sha))
+
+    def add_file(self, path):
+        """Compress 'path' into the store, hashing it in the same pass. Returns its SHA-256."""
+        sha256 = hashlib.sha256()
+        compressor = zlib.compressobj(6)
+        tmp = os.path.join(self.objects_dir, 'new.%d.tmp' % os.getpid())
+        with open(path, 'rb') as src, open(tmp, 'wb') as dst:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                sha256.update(chunk)
+                dst.write(compressor.compress(chunk))
+            dst.write(compressor.flush())
+        sha = sha256.hexdigest()
+        object_path = self._object_path(sha)
+        if os.path.exists(object_path):
+            os.remove(tmp)
+        else:
+            if not os.path.isdir(os.path.dirname(object_path)):
+                os.makedirs(os.path.dirname(object_path))
+            os.rename(tmp, object_path)
+        return sha
+
+    def extract_object(self, sha, dst):
+        """Write the decompressed contents of object 'sha' to the file object 'dst'."""
+        decompressor = zlib.decompressobj()
+        with open(self._object_path(sha), 'rb') as src:
+            for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                dst.write(decompressor.decompress(chunk))
+        dst.write(decompressor.flush())
+
+    def _objects(self):
+        for path, _ in walk_files(self.objects_dir):
+            yield os.path.basename(path), path
+
+    def size(self):
+        return sum(os.path.getsize(path) for _, path in self._objects())
+
+    def evict(self, budget, keep=None):
+        """Drop the least recently used snapshots until the store fits into 'budget' bytes."""
+        manifests = []
+        for name in os.listdir(self.manifests_dir):
+            key = name[:-len('.json')]
+            if name.endswith('.json') and key != keep:
+                manifests.append((self.load_manifest(key)['last_used'], key))
+        manifests.sort()
+
+        while self.size() > budget and manifests:
+            _, key = manifests.pop(0)
+            os.remove(self._manifest_path(key))
+            referenced = set()
+            for name in os.listdir(self.manifests_dir):
+                if name.endswith('.json'):
+                    referenced.update(f['sha'] for f in self.load_manifest(name[:-len('.json')])['files'].values())
+            for sha, path in list(self._objects()):
+                if sha not in referenced:
+                    os.remove(path)
+            print('Evicted build snapshot %s' % key)
+
+
+def save_snapshot(store, project_dir, build_dir, key, budget):
+    """Store the current contents of 'build_dir' as the snapshot 'key'."""
+    stat_cache_path = os.path.join(build_dir, SNAPSHOT_STAT_CACHE)
+    try:
+        with open(stat_cache_path) as f:
+            stat_cache = json.load(f)
+    except (IOError, OSError, ValueError):
+        stat_cache = {}
+
+    files = {}
+    new_stat_cache = {}
+    with store.lock():
+        for rel_path in snapshot_files(project_dir, build_dir):
+            path = os.path.join(build_dir, rel_path)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            cached = stat_cache.get(rel_path)
+            # objects of unchanged files may have been evicted from the store meanwhile
+            if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns and store.has_object(cached[2]):
+                sha = cached[2]
+            else:
+                sha = store.add_file(path)
+            new_stat_cache[rel_path] = [st.st_size, st.st_mtime_ns, sha]
+            files[rel_path] = {'sha': sha, 'mode': st.st_mode & 0o777, 'mtime_ns': st.st_mtime_ns}
+
+        now = time.time()
+        store.save_manifest(key, {'created': now, 'last_used': now, 'files': files})
+        store.evict(budget, keep=key)
+
+    write_atomic(stat_cache_path, json.dumps(new_stat_cache))
+
+
+def restore_snapshot(store, project_dir, build_dir, key):
+    """Restore the snapshot 'key' into 'build_dir'. Returns the number of restored files."""
+    with store.lock():
+        manifest = store.load_manifest(key)
+        manifest['last_used'] = time.time()
+        store.save_manifest(key, manifest)
+
+        files = manifest['files']
+        if not files:
+            return 0
+        toplevel = _git_toplevel(project_dir)
+        tracked = set()
+        if toplevel is not None and _git_toplevel(build_dir) == toplevel:
+            out = _git(build_dir, 'ls-files', '-z')
+            tracked = set(f for f in out.decode('utf-8').split('\0') if f) if out else set()
+
+        # Shift the timestamps so the newest restored file is dated now. Sources touched by the
+        # checkout are then older than the restored outputs, and their relative order is kept.
+        shift = time.time_ns() - max(f['mtime_ns'] for f in files.values())
+        restored = 0
+        for rel_path, entry in sorted(files.items()):
+            # snapshots of older versions may hold other files
+            if rel_path in tracked or not is_build_output(rel_path):
+                continue
+            path = os.path.join(build_dir, rel_path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+
+            def create(tmp):
+                with open(tmp, 'wb') as f:
+                    store.extract_object(entry['sha'], f)
+                os.chmod(tmp, entry['mode'])
+                os.utime(tmp, ns=(entry['mtime_ns'] + shift, entry['mtime_ns'] + shift))
+            replace_file(path, create)
+            restored += 1
+    return restored
+
+
+def read_snapshot_key(build_dir):
+    try:
+        with open(os.path.join(build_dir, SNAPSHOT_KEY_FILE)) as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return None
+
+
+def write_snapshot_key(build_dir, key):
+    path = os.path.join(build_dir, SNAPSHOT_KEY_FILE)
+    if key is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path, 'w') as f:
+        f.write(key + '\n')
+
+
+def start_background_snapshot(store_dir, project_dir, build_dir, key, budget, lock):
+    """Save the snapshot in a detached process, so woh.py doesn't wait for it.
+
+    The process takes over 'lock', the BuildDirLock of 'build_dir', so no other run can change the
+    build directory before the snapshot is saved.
+    """
+    lock_fd = lock.hand_over()
+    log = open(os.path.join(store_dir, 'snapshot.log'), 'a')
+    subprocess.Popen(
+        [sys.executable, '-m', 'woh_py_actions.snapshots', '--lock-fd', str(lock_fd),
+         store_dir, project_dir, build_dir, key, str(budget)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+        start_new_session=True, pass_fds=(lock_fd,))
+    log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Save a woh.py build directory snapshot')
+    parser.add_argument('store_dir')
+    parser.add_argument('project_dir')
+    parser.add_argument('build_dir')
+    parser.add_argument('key')
+    parser.add_argument('budget', type=int)
+    parser.add_argument('--lock-fd', type=int, help='Inherited file descriptor holding the build directory lock')
+    args = parser.parse_args()
+    try:
+        save_snapshot(SnapshotStore(args.store_dir), args.project_dir, args.build_dir, args.key, args.budget)
+    except FatalError as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    finally:
+        # lets the next build use the build directory
+        if args.lock_fd is not None:
+            os.close(args.lock_fd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import os
+import signal
+import subprocess
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+from .errors import FatalError
+
+# Signals sent to the process group of a cancelled tool, each one after the previous didn't stop it
+ESCALATION = [signal.SIGINT, signal.SIGTERM, signal.SIGKILL]
+ESCALATION_GRACE = 5.0
+POLL_INTERVAL = 0.1
+
+# Supervisors of the running tools of all threads. The lock is only taken by the threads running
+# tools, never by the signal handler, which may interrupt a thread holding it.
+_active = set()
+_active_lock = threading.Lock()
+# number of Ctrl+C and SIGTERM received, and the name of the last one
+_interrupts = 0
+_interrupted = None
+
+
+def interrupt(signum):
+    """Handle Ctrl+C or SIGTERM received by woh.py.
+
+    Running tools are cancelled by their supervisors, which raise FatalError in the threads waiting
+    for them. Without running tools FatalError is raised right away. No tool is started afterwards.
+    """
+    global _interrupts, _interrupted
+    _interrupted = signal.Signals(signum).name
+    _interrupts += 1
+    if not _active:
+        raise FatalError('Interrupted by %s' % _interrupted)
+
+
+class ResourceUsage(object):
+    def __init__(self, wall_time, rusage):
+        self.wall_time = wall_time
+        self.user_time = rusage.ru_utime
+        self.system_time = rusage.ru_stime
+        # kilobytes on Linux
+        self.peak_rss = rusage.ru_maxrss * 1024
+
+    def __str__(self):
+        return 'wall %.1fs, CPU user %.1fs system %.1fs, peak RSS %.1f MB' % (
+            self.wall_time, self.user_time, self.system_time, self.peak_rss / (1024.0 * 1024.0))
+
+
+def _set_limits(max_memory, max_cpu_time):
+    def preexec():
+        # limits are per process and inherited by all children of the tool
+        if max_memory:
+            resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+        if max_cpu_time:
+            resource.setrlimit(resource.RLIMIT_CPU, (max_cpu_time, max_cpu_time))
+    return preexec
+
+
+def _exit_code(status):
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class Supervisor(object):
+    """Runs a tool in its own process group, so that it can be cancelled with all its children.
+
+    Ctrl+C and SIGTERM received by woh.py, see interrupt(), as well as the timeout, send SIGINT to the
+    process group. If the tool doesn't exit, SIGTERM and SIGKILL follow after ESCALATION_GRACE seconds
+    each. A second Ctrl+C escalates immediately.
+    """
+
+    def __init__(self, tool_name, timeout=None, max_memory=None, max_cpu_time=None):
+        self.tool_name = tool_name
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.max_cpu_time = max_cpu_time
+        self._cancel_reason = None
+        self._escalation = 0
+        self._escalated_at = None
+        self._pgid = None
+        self._interrupts_seen = 0
+        self.timed_out = False
+
+    def _escalate(self):
+        sig = ESCALATION[min(self._escalation, len(ESCALATION) - 1)]
+        self._escalation += 1
+        self._escalated_at = time.time()
+        try:
+            os.killpg(self._pgid, sig)
+        except OSError:
+            pass
+
+    def _cancel(self, reason):
+        if self._cancel_reason is None:
+            self._cancel_reason = reason
+            print('\nStopping %s (%s)...' % (self.tool_name, reason))
+        self._escalate()
+
+    def run(self, args, cwd, env, pass_fds=(), stdout=subprocess.DEVNULL, stderr=None):
+        """Run the tool until it exits. Returns a tuple (exit code, ResourceUsage).
+
+        A tool stopped after the timeout sets 'timed_out', a tool stopped by Ctrl+C or SIGTERM raises FatalError.
+        """
+        if (self.max_memory or self.max_cpu_time) and resource is None:
+            raise FatalError('Resource limits are not supported on this platform')
+        # preexec_fn is not safe with threads, it is used only when limits are requested
+        preexec_fn = _set_limits(self.max_memory, self.max_cpu_time) if self.max_memory or self.max_cpu_time else None
+
+        with _active_lock:
+            if _interrupted is not None:
+                raise FatalError('%s not started, interrupted by %s' % (self.tool_name, _interrupted))
+            _active.add(self)
+        try:
+            start = time.time()
+            proc = subprocess.Popen(args, env=env, cwd=cwd, pass_fds=pass_fds, stdout=stdout, stderr=stderr,
+                                    start_new_session=True, preexec_fn=preexec_fn)
+            self._pgid = proc.pid
+            while True:
+                pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+                if pid:
+                    break
+                now = time.time()
+                if _interrupts != self._interrupts_seen:
+                    # every Ctrl+C escalates
+                    self._interrupts_seen = _interrupts
+                    self._cancel('interrupted by %s' % _interrupted)
+                elif self._cancel_reason is None and self.timeout and now - start > self.timeout:
+                    self.timed_out = True
+                    self._cancel('timed out after %d seconds' % self.timeout)
+                elif self._cancel_reason is not None and now - self._escalated_at > ESCALATION_GRACE:
+                    self._escalate()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            with _active_lock:
+                _active.discard(self)
+        # reaped by wait4, keep Popen from waiting for it again
+        proc.returncode = _exit_code(status)
+        usage = ResourceUsage(time.time() - start, rusage)
+
+        if self._cancel_reason is not None:
+            # children which outlived the tool
+            try:
+                os.killpg(self._pgid, signal.SIGKILL)
+            except OSError:
+                pass
+            if self._interrupts_seen:
+                raise FatalError('%s interrupted by %s (%s)' % (self.tool_name, _interrupted, usage))
+        return proc.returncode, usage
@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+
+import click
+
+from woh_py_actions.constants import PACKAGE_DIR, TEST_PATTERNS, TEST_REPORT_FILE
+from woh_py_actions.errors import FatalError
+from woh_py_actions.test_runner import CACHED, FAILED, FLAKY, discover_tests, run_tests, write_junit_xml
+from woh_py_actions.tools import ensure_build_directory
+
+
+def action_extensions(base_action, project_path):
+    def test(action, ctx, args, jobs, timeout, pattern, test_data, no_cache, junit):
+        """Run the project test binaries in parallel."""
+        ensure_build_directory(args, ctx.info_name)
+        exclude_dirs = [os.path.join(args.build_dir, PACKAGE_DIR)]
+        tests = discover_tests(args.build_dir, pattern or TEST_PATTERNS, exclude_dirs)
+        if not tests:
+            print('No test binaries found in %s' % args.build_dir)
+            return
+
+        results = run_tests(args.build_dir, tests, jobs, timeout, [os.path.realpath(d) for d in test_data],
+                            use_cache=not no_cache, exclude_dirs=exclude_dirs)
+        for result in results:
+            print('%-7s %s (%.2fs)' % (result.status.upper(), result.name, result.duration))
+            if result.status == FAILED:
+                print(result.output)
+
+        junit = junit or os.path.join(args.build_dir, TEST_REPORT_FILE)
+        write_junit_xml(junit, results)
+        print('JUnit report written to %s' % junit)
+
+        failed = [r for r in results if r.status == FAILED]
+        print('%d test(s): %d failed, %d flaky, %d unchanged and skipped' % (
+            len(results), len(failed), len([r for r in results if r.status == FLAKY]),
+            len([r for r in results if r.status == CACHED])))
+        if failed:
+            raise FatalError('%d test(s) failed' % len(failed))
+
+    test_actions = {
+        'actions': {
+            'test': {
+                'callback': test,
+                'short_help': 'Run the project test binaries.',
+                'help': (
+                    'Run the test binaries found in the build directory, sharded across all cores with the '
+                    'longest tests first. Tests which passed before and whose binary and data directories are '
+                    'unchanged are skipped. Failed tests are re-run in isolation. Results are written as JUnit XML.'
+                ),
+                'dependencies': ['all'],
+                'options': [
+                    {
+                        'names': ['--jobs'],
+                        'help': 'Number of tests run in parallel.',
+                        'type': int,
+                        'default': multiprocessing.cpu_count(),
+                    },
+                    {
+                        'names': ['--timeout'],
+                        'help': 'Timeout of a single test in seconds.',
+                        'type': int,
+                        'default': None,
+                    },
+                    {
+                        'names': ['--pattern'],
+                        'help': 'File name pattern of test binaries. Can be given multiple times.',
+                        'multiple': True,
+                    },
+                    {
+                        'names': ['--test-data'],
+                        'help': ('Directory with data used by the tests. Changes in it invalidate cached results. '
+                                 'Can be given multiple times.'),
+                        'type': click.Path(exists=True, file_okay=False),
+                        'multiple': True,
+                    },
+                    {
+                        'names': ['--no-cache'],
+                        'help': 'Run all tests, also those which passed before with unchanged inputs.',
+                        'is_flag': True,
+                        'default': False,
+                    },
+                    {
+                        'names': ['--junit'],
+                        'help': 'Path of the JUnit XML report. Default is test_results.xml in the build directory.',
+                        'type': click.Path(),
+                        'default': None,
+                    },
+                ],
+            },
+        },
+    }
+
+    return test_actions
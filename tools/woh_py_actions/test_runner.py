@@ -0,0 +1,170 @@
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from .supervisor import Supervisor
+from .tools import file_sha256, walk_files, write_atomic
+
+TEST_CACHE_FILE = '.woh_test_cache.json'
+# Libraries the tests may load at run time, a rebuilt one changes the result without changing the test binary
+SHARED_LIBRARY_PATTERNS = ['*.so', '*.so.[0-9]*', '*.dylib']
+
+PASSED = 'passed'
+FAILED = 'failed'
+FLAKY = 'flaky'
+CACHED = 'cached'
+
+
+class TestResult(object):
+    def __init__(self, name, status, duration=0.0, returncode=0, output=''):
+        self.name = name
+        self.status = status
+        self.duration = duration
+        self.returncode = returncode
+        self.output = output
+
+
+def discover_tests(build_dir, patterns, exclude_dirs=()):
+    """Return the sorted paths of executable files in 'build_dir' matching 'patterns', relative to 'build_dir'."""
+    tests = []
+    for path, rel_path in walk_files(build_dir, exclude_dirs):
+        # walk_files yields symbolic links to directories too
+        if (any(fnmatch.fnmatch(os.path.basename(path), p) for p in patterns) and os.path.isfile(path) and
+                os.access(path, os.X_OK)):
+            tests.append(rel_path)
+    return sorted(tests)
+
+
+def inputs_hash(data_dirs):
+    """Hash the contents of all files in 'data_dirs', the inputs shared by all tests."""
+    sha256 = hashlib.sha256()
+    for data_dir in sorted(data_dirs):
+        for path, rel_path in walk_files(data_dir):
+            if not os.path.isfile(path):
+                continue
+            sha256.update(rel_path.encode('utf-8'))
+            sha256.update(file_sha256(path).encode('utf-8'))
+    return sha256.hexdigest()
+
+
+def libraries_hash(build_dir, exclude_dirs=()):
+    """Hash the contents of the shared libraries built in 'build_dir'."""
+    sha256 = hashlib.sha256()
+    for path, rel_path in walk_files(build_dir, exclude_dirs):
+        if any(fnmatch.fnmatch(os.path.basename(path), p) for p in SHARED_LIBRARY_PATTERNS) and os.path.isfile(path):
+            sha256.update(rel_path.encode('utf-8'))
+            sha256.update(file_sha256(path).encode('utf-8'))
+    return sha256.hexdigest()
+
+
+def test_key(build_dir, name, shared_inputs_hash):
+    binary_hash = file_sha256(os.path.join(build_dir, name))
+    return hashlib.sha256((binary_hash + shared_inputs_hash).encode('utf-8')).hexdigest()
+
+
+def load_test_cache(build_dir):
+    try:
+        with open(os.path.join(build_dir, TEST_CACHE_FILE)) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def save_test_cache(build_dir, cache):
+    write_atomic(os.path.join(build_dir, TEST_CACHE_FILE), json.dumps(cache, indent=4, sort_keys=True))
+
+
+def run_test(build_dir, name, timeout=None):
+    """Run one test in its own process group. Raises FatalError if woh.py is interrupted."""
+    path = os.path.join(build_dir, name)
+    supervisor = Supervisor(name, timeout)
+    start = time.time()
+    with tempfile.TemporaryFile() as output_file:
+        try:
+            returncode, _ = supervisor.run([path], os.path.dirname(path), None, stdout=output_file,
+                                           stderr=subprocess.STDOUT)
+        except OSError as e:
+            returncode = None
+            output_file.write(str(e).encode('utf-8'))
+        output_file.seek(0)
+        output = output_file.read()
+    if supervisor.timed_out:
+        returncode, output = None, output + b'\nTimed out after %d seconds' % timeout
+    status = PASSED if returncode == 0 else FAILED
+    return TestResult(name, status, time.time() - start, returncode, output.decode('utf-8', 'replace'))
+
+
+def run_tests(build_dir, tests, jobs=None, timeout=None, data_dirs=(), use_cache=True, exclude_dirs=()):
+    """Run 'tests' sharded across 'jobs' workers, longest first. Returns a list of TestResult.
+
+    Tests that passed before with an unchanged binary, unchanged shared libraries and unchanged data
+    directories are skipped.
+    Failed tests are re-run one at a time to tell real failures from interference between tests.
+    """
+    cache = load_test_cache(build_dir)
+    shared_inputs_hash = inputs_hash(data_dirs) + libraries_hash(build_dir, exclude_dirs)
+    keys = dict((name, test_key(build_dir, name, shared_inputs_hash)) for name in tests)
+
+    results = OrderedDict()
+    to_run = []
+    for name in tests:
+        entry = cache.get(name, {})
+        if use_cache and entry.get('passed_key') == keys[name]:
+            results[name] = TestResult(name, CACHED)
+        else:
+            to_run.append(name)
+
+    # tests without a known duration go first, they may be the longest ones
+    to_run.sort(key=lambda name: cache.get(name, {}).get('duration', float('inf')), reverse=True)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for result in executor.map(lambda name: run_test(build_dir, name, timeout), to_run):
+            results[result.name] = result
+
+    for name in [n for n in to_run if results[n].status == FAILED]:
+        print('Re-running failed test %s in isolation...' % name)
+        result = run_test(build_dir, name, timeout)
+        if result.status == PASSED:
+            results[name].status = FLAKY
+
+    for name in to_run:
+        result = results[name]
+        cache[name] = {
+            'duration': result.duration,
+            'passed_key': keys[name] if result.status == PASSED else None,
+        }
+    save_test_cache(build_dir, cache)
+    return [results[name] for name in tests]
+
+
+def write_junit_xml(path, results, suite_name='woh'):
+    suite = ElementTree.Element('testsuite', {
+        'name': suite_name,
+        'tests': str(len(results)),
+        'failures': str(len([r for r in results if r.status == FAILED])),
+        'skipped': str(len([r for r in results if r.status == CACHED])),
+        'time': '%.3f' % sum(r.duration for r in results),
+    })
+    for result in results:
+        case = ElementTree.SubElement(suite, 'testcase', {
+            'classname': suite_name,
+            'name': result.name.replace(os.sep, '/'),
+            'time': '%.3f' % result.duration,
+        })
+        if result.status == FAILED:
+            failure = ElementTree.SubElement(case, 'failure', {'message': 'exit code %s' % result.returncode})
+            failure.text = result.output
+        elif result.status == CACHED:
+            ElementTree.SubElement(case, 'skipped', {'message': 'passed before, inputs unchanged'})
+        elif result.status == FLAKY:
+            output = ElementTree.SubElement(case, 'system-out')
+            output.text = 'Failed when run in parallel, passed in isolation.\n' + result.output
+    root = ElementTree.Element('testsuites')
+    root.append(suite)
+    ElementTree.ElementTree(root).write(path, encoding='utf-8', xml_declaration=True)
@@ -1,9 +1,11 @@
+import hashlib
 import os
 import subprocess
 import sys
 
-from .constants import GENERATORS
+from .constants import GENERATORS, VCS_DIRS
 from .errors import FatalError
+from .supervisor import Supervisor
 
 
 def executable_exists(args):
@@ -19,6 +21,57 @@ def realpath(path):
     return os.path.normcase(os.path.realpath(path))
 
 
+def file_sha256(path, chunk_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def walk_files(top, exclude_dirs=()):
+    """Yield (path, path relative to 'top') of all files under 'top', in sorted order.
+
+    Version control directories and 'exclude_dirs' are skipped, symbolic links to directories are
+    yielded as files.
+    """
+    exclude_dirs = set(realpath(d) for d in exclude_dirs)
+    for dirpath, dirnames, filenames in os.walk(top):
+        for name in sorted(dirnames):
+            path = os.path.join(dirpath, name)
+            if name in VCS_DIRS or realpath(path) in exclude_dirs:
+                dirnames.remove(name)
+            elif os.path.islink(path):
+                dirnames.remove(name)
+                filenames.append(name)
+        dirnames.sort()
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            yield path, os.path.relpath(path, top)
+
+
+def replace_file(path, create):
+    """Replace 'path' by the file 'create(tmp_path)' makes, so readers never see a partly written file."""
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        create(tmp)
+        os.rename(tmp, path)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def write_atomic(path, data):
+    """Replace the contents of 'path' with 'data', str or bytes."""
+    def write(tmp):
+        with open(tmp, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+    replace_file(path, write)
+
+
 def _woh_version_from_ide():
     return ""
 
@@ -62,6 +115,13 @@ def ensure_build_directory(args, prog_name, always_run_make=False):
         os.makedirs(build_dir)
 
     # args.define_cache_entry.append('CCACHE_ENABLE=%d' % args.ccache)
+    # imported here, config_cache uses the file helpers of this module
+    from .config_cache import print_config_changes, update_config_cache
+    if 'config_cache' not in args:
+        args.config_cache, changes = update_config_cache(build_dir, args.define_cache_entry,
+                                                               args.undefine_cache_entry)
+        print_config_changes(changes)
+
     generator = _detect_make_generator(prog_name)
     if args.generator is None:
         args.generator = generator
@@ -74,16 +134,18 @@ def merge_action_lists(*action_lists):
         'global_options': [],
         'actions': {},
         'global_action_callbacks': [],
+        'global_action_finalizers': [],
     }
     for action_list in action_lists:
         merged_actions['global_options'].extend(action_list.get('global_options', []))
         merged_actions['actions'].update(action_list.get('actions', {}))
         merged_actions['global_action_callbacks'].extend(action_list.get('global_action_callbacks', []))
+        merged_actions['global_action_finalizers'].extend(action_list.get('global_action_finalizers', []))
     return merged_actions
 
 
 
-def run_tool(tool_name, args, cwd, env=dict()):
+def run_tool(tool_name, args, cwd, env=dict(), pass_fds=(), timeout=None, max_memory=None, max_cpu_time=None):
     def quote_arg(arg):
         " Quote 'arg' if necessary "
         if ' ' in arg and not (arg.startswith('"') or arg.startswith("'")):
@@ -103,15 +165,32 @@ def run_tool(tool_name, args, cwd, env=dict()):
             if not isinstance(val, str):
                 env_copy[key] = val.encode(sys.getfilesystemencoding() or 'utf-8')
 
-    try:
-        subprocess.check_output(args, env=env_copy, cwd=cwd)
-    except subprocess.CalledProcessError as e:
-        raise FatalError('%s failed with exit code %d' % (tool_name, e.returncode))
+    supervisor = Supervisor(tool_name, timeout, max_memory, max_cpu_time)
+    returncode, usage = supervisor.run(args, cwd, env_copy, pass_fds)
+    print('%s resource usage: %s' % (tool_name, usage))
+    if supervisor.timed_out:
+        raise FatalError('%s timed out after %d seconds' % (tool_name, timeout))
+    if returncode != 0:
+        raise FatalError('%s failed with exit code %d' % (tool_name, returncode))
 
 
 def run_target(target_name, args, env=dict()):
-    generator_cmd = GENERATORS[args.generator]['command']
+    job_pool = args.get('job_pool')
+    if job_pool is not None:
+        generator_cmd = list(GENERATORS[args.generator]['jobserver_command'])
+        env = job_pool.make_env(env)
+    else:
+        generator_cmd = list(GENERATORS[args.generator]['command'])
 
     if args.verbose:
         generator_cmd += [GENERATORS[args.generator]['verbose_flag']]
-    run_tool(generator_cmd[0], generator_cmd + [target_name], args.build_dir, env)
\ No newline at end of file
+    if 'config_cache' in args:
+        from .config_cache import make_variables
+        generator_cmd += make_variables(args.build_dir, args.config_cache)
+    targets = target_name if isinstance(target_name, list) else [target_name]
+    max_memory = args.get('max_memory')
+    run_tool(generator_cmd[0], generator_cmd + targets, args.build_dir, env,
+             pass_fds=(job_pool.fd,) if job_pool is not None else (),
+             timeout=args.get('action_timeout'),
+             max_memory=max_memory * 1024 * 1024 if max_memory else None,
+             max_cpu_time=args.get('max_cpu_time'))
\ No newline at end of file